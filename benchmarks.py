@@ -0,0 +1,622 @@
+import sys
+import os
+import time
+import random
+import heapq
+import math
+import tempfile
+import tracemalloc
+from array import array
+from collections import namedtuple
+
+from sos6 import (UserDataStore, LocationHistory, LOCATION_HISTORY_WINDOW, KeywordListener, AUDIO_RATE,
+                  AUDIO_CHUNK, IntentMatcher, KeywordScanner, AudioDeviceManager, SmsDispatcher, AlertOutbox,
+                  MockSmsGateway, HttpGatewayTransport, LocationSharingSession, LOCATION_SHARING_INTERVAL,
+                  TrackingPolicy, TRACKER_BASE_INTERVAL, haversine_m, LocationFix, LocationSourceChain,
+                  SOS_LOCATION_BUDGET, IP_LOCATION_ACCURACY, SafePlaceIndex, GeofenceEngine,
+                  analyse_trajectory, trajectory_summary, TRAJECTORY_DWELL_SPEED, TRAJECTORY_DWELL_RADIUS_M,
+                  TRAJECTORY_DWELL_MIN_DURATION, TRAJECTORY_JUMP_SPEED, TRAJECTORY_JUMP_MIN_DISTANCE)
+
+# Benchmarks for the safety app's hot paths.
+# Run one with `python3 benchmarks.py <name>`, or all of them with no arguments.
+
+def synthetic_fixes(n, start=1.6e9, interval=300):
+    lat, lng = 52.52, 13.405
+    for i in range(n):
+        lat += random.uniform(-1e-4, 1e-4)
+        lng += random.uniform(-1e-4, 1e-4)
+        yield start + i * interval, lat, lng
+
+def traced_bytes(build):
+    tracemalloc.start()
+    result = build()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, used
+
+def bench_history_memory(n=1000000):
+    def build_dicts():
+        return [{"timestamp": t, "location": [lat, lng]} for t, lat, lng in synthetic_fixes(n)]
+
+    def build_arrays():
+        timestamps, lats, lngs = array('d'), array('d'), array('d')
+        for t, lat, lng in synthetic_fixes(n):
+            timestamps.append(t)
+            lats.append(lat)
+            lngs.append(lng)
+        return timestamps, lats, lngs
+
+    dicts, dict_bytes = traced_bytes(build_dicts)
+    del dicts
+    columns, array_bytes = traced_bytes(build_arrays)
+    del columns
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = UserDataStore(os.path.join(directory, "bench.db"))
+        with store.conn:
+            store.conn.executemany("INSERT INTO location_history (timestamp, lat, lng) VALUES (?, ?, ?)",
+                                   synthetic_fixes(n))
+        history, window_bytes = traced_bytes(lambda: LocationHistory(store))
+        started = time.perf_counter()
+        all_fixes = history.between()
+        read_back = time.perf_counter() - started
+        del history, all_fixes
+        store.close()
+
+    print(f"Location history memory for {n} fixes:")
+    print(f"  list of dicts        {dict_bytes / n:8.1f} bytes/fix  {dict_bytes / 2**20:8.1f} MiB")
+    print(f"  columnar arrays      {array_bytes / n:8.1f} bytes/fix  {array_bytes / 2**20:8.1f} MiB")
+    print(f"  bounded window       {window_bytes / n:8.1f} bytes/fix  {window_bytes / 2**20:8.1f} MiB"
+          f"  (newest {LOCATION_HISTORY_WINDOW} in memory)")
+    print(f"  all history          {read_back:8.2f} s to page every fix back in")
+
+def noise_frame(amplitude):
+    return array('h', (random.randint(-amplitude, amplitude) for _ in range(AUDIO_CHUNK))).tobytes()
+
+def bench_listener_silence(seconds=600):
+    # Room noise well under the VAD threshold: the recognizer must never start
+    listener = KeywordListener(None, ["help me", "help"])
+    frames = [noise_frame(60) for _ in range(32)]
+    count = int(seconds * AUDIO_RATE / AUDIO_CHUNK)
+    started = time.process_time()
+    for i in range(count):
+        listener.process_frame(frames[i % len(frames)])
+    cpu = time.process_time() - started
+    print(f"Always-on listener, {seconds}s of silence ({count} frames):")
+    print(f"  CPU time {cpu:.3f}s = {100 * cpu / seconds:.3f}% of one core, "
+          f"{1e6 * cpu / count:.1f} us/frame, {listener.segments} recognizer segments")
+
+# (utterance, expected intent); also run as a correctness check before timing, and any
+# mismatch fails the benchmark run
+INTENT_MATRIX = [
+    ("SOS", "sos"),
+    ("send an SOS now", "sos"),
+    ("activate sos please", "sos"),
+    ("cancel SOS", "cancel_sos"),
+    ("please cancel the sos", "cancel_sos"),
+    ("stop sos, I'm fine", "cancel_sos"),
+    ("sos cancel", "cancel_sos"),
+    ("check in", "check_in"),
+    ("Check-in with my contacts", "check_in"),
+    ("update my location", "location"),
+    ("where am I", "location"),
+    ("call emergency services", "call_emergency"),
+    ("make an emergency call", "call_emergency"),
+    ("call 112", "call_emergency"),
+    ("find nearby safe places", "nearby_safe"),
+    ("is there a safe place near me", "nearby_safe"),
+    ("analyse my mood", "mood"),
+    ("mood", "mood"),
+    ("emergency", None),
+    ("sauce", None),
+    ("crosses the road", None),
+    ("what's the weather", None),
+    ("", None),
+    ("take me home", "location"),  # user-defined phrase
+    ("Über Notfall!", "sos"),  # user-defined phrase outside ASCII
+]
+
+def legacy_classify(command):
+    # The original if-chain from voice_command, kept as the baseline
+    if "sos" in command.lower():
+        return "sos"
+    elif "cancel" in command.lower() and "sos" in command.lower():
+        return "cancel_sos"
+    elif "check in" in command.lower():
+        return "check_in"
+    elif "location" in command.lower():
+        return "location"
+    elif "emergency" in command.lower() and "call" in command.lower():
+        return "call_emergency"
+    elif "nearby" in command.lower() and "safe" in command.lower():
+        return "nearby_safe"
+    elif "mood" in command.lower():
+        return "mood"
+    return None
+
+def bench_intent_matcher(rounds=20000):
+    matcher = IntentMatcher(custom_phrases={"take me home": "location", "über notfall": "sos"})
+    failures = [(text, expected, matcher.match(text)) for text, expected in INTENT_MATRIX
+                if matcher.match(text) != expected]
+    if failures:
+        raise AssertionError("IntentMatcher: " + "; ".join(
+            f"{text!r} expected {expected}, got {got}" for text, expected, got in failures))
+    legacy_wrong = sum(legacy_classify(text) != expected for text, expected in INTENT_MATRIX)
+    utterances = [text for text, _ in INTENT_MATRIX]
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in utterances:
+            legacy_classify(text)
+    legacy = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in utterances:
+            matcher.match(text)
+    compiled = time.perf_counter() - started
+
+    count = rounds * len(utterances)
+    print(f"Intent matcher over {len(INTENT_MATRIX)} utterances x {rounds}:")
+    print(f"  if-chain       {1e6 * legacy / count:6.2f} us/utterance, {legacy_wrong} wrong")
+    print(f"  IntentMatcher  {1e6 * compiled / count:6.2f} us/utterance, 0 wrong")
+
+def random_word(length):
+    return "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(length))
+
+def bench_keyword_scanner(keywords=5000, transcript_words=300, rounds=200):
+    vocabulary = [random_word(random.randint(3, 9)) for _ in range(20000)]
+    keyword_list = [" ".join(random.sample(vocabulary, random.choice((1, 1, 2, 3)))) for _ in range(keywords)]
+    transcript = " ".join(random.choice(vocabulary) for _ in range(transcript_words))
+
+    started = time.perf_counter()
+    scanner = KeywordScanner(keyword_list)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        lowered = transcript.lower()
+        [keyword for keyword in keyword_list if keyword in lowered]
+    substring = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(rounds):
+        scanner.scan(transcript)
+    automaton = time.perf_counter() - started
+
+    print(f"Keyword scan, {keywords} keywords, {transcript_words}-word transcript:")
+    print(f"  substring loop   {1e3 * substring / rounds:7.3f} ms/transcript")
+    print(f"  KeywordScanner   {1e3 * automaton / rounds:7.3f} ms/transcript (built once in {1e3 * build:.1f} ms)")
+    print(f"  'help' in 'that was helpful': substring {'help' in 'that was helpful'}, "
+          f"scanner {bool(KeywordScanner(['help']).scan('that was helpful'))}")
+
+def bench_audio_startup(trials=5):
+    # Needs a microphone. "Cold" is what every SOS paid before: initialise PortAudio,
+    # open a stream and wait for the first chunk. "Warm" opens a session on the
+    # shared, already running stream.
+    import pyaudio
+    cold = []
+    for _ in range(trials):
+        started = time.perf_counter()
+        audio = pyaudio.PyAudio()
+        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=AUDIO_RATE, input=True,
+                            frames_per_buffer=AUDIO_CHUNK)
+        stream.read(AUDIO_CHUNK, exception_on_overflow=False)
+        cold.append(time.perf_counter() - started)
+        stream.stop_stream()
+        stream.close()
+        audio.terminate()
+
+    manager = AudioDeviceManager()
+    manager.start()
+    warm = []
+    for _ in range(trials):
+        started = time.perf_counter()
+        session = manager.open_session()
+        session.read()
+        warm.append(time.perf_counter() - started)
+        session.close()
+    manager.shutdown()
+
+    print(f"SOS trigger to first captured audio frame ({trials} trials, median):")
+    print(f"  cold PyAudio per recording  {1000 * sorted(cold)[trials // 2]:7.1f} ms")
+    print(f"  warm shared stream          {1000 * sorted(warm)[trials // 2]:7.1f} ms")
+
+def bench_outbox_drain(alerts=500, contacts=4):
+    gateway = MockSmsGateway(latency=0.02, error_rate=0.02)
+    dispatcher = SmsDispatcher(HttpGatewayTransport(gateway.start()), "+10000000000")
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = AlertOutbox(dispatcher, os.path.join(directory, "bench.db"), base_delay=0.05, max_delay=1.0)
+        numbers = [f"+1555000{i:04d}" for i in range(contacts)]
+        started = time.perf_counter()
+        for i in range(alerts):
+            outbox.enqueue(f"SOS test {i}", numbers)
+        enqueued = time.perf_counter() - started
+        while outbox.pending_count():
+            time.sleep(0.01)
+        drained = time.perf_counter() - started
+        failed = outbox.conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'failed'").fetchone()[0]
+        retries = outbox.conn.execute("SELECT COALESCE(SUM(attempts - 1), 0) FROM outbox").fetchone()[0]
+        outbox.stop()
+        outbox.thread.join()
+        outbox.conn.close()
+    dispatcher.shutdown()
+    gateway.stop()
+
+    count = alerts * contacts
+    print(f"Outbox drain, {count} messages, 20 ms gateway latency, 2% errors:")
+    print(f"  enqueue  {1e6 * enqueued / count:7.1f} us/message (fsync'd)")
+    print(f"  drain    {count / drained:7.1f} msgs/s, {retries} retries, {failed} given up")
+
+def bench_sms_transport(messages=400, sequential=100, latency=0.01):
+    # Same gateway, same concurrency; only connection handling differs
+    gateway = MockSmsGateway(latency=latency)
+    url = gateway.start()
+    batch = [(f"SOS test {i}", f"+1555{i:07d}") for i in range(messages)]
+    print(f"SMS transport, {messages} messages to a local gateway with {1000 * latency:.0f} ms latency:")
+    for label, pooled in (("new connection per message", False), ("pooled keep-alive session", True)):
+        transport = HttpGatewayTransport(url, pooled=pooled)
+        transport.send("warm-up", "+10000000000", "+15550000000")
+        started = time.perf_counter()
+        for body, contact in batch[:sequential]:
+            transport.send(body, "+10000000000", contact)
+        overhead = (time.perf_counter() - started) / sequential - latency
+
+        dispatcher = SmsDispatcher(transport, "+10000000000")
+        dispatcher.send_batch(batch[:8])  # Warm the thread pool (and the pool's connections)
+        connections = gateway.stats["connections"]
+        started = time.perf_counter()
+        results = dispatcher.send_batch(batch)
+        elapsed = time.perf_counter() - started
+        dispatcher.shutdown()
+        print(f"  {label:28s} {1000 * overhead:6.2f} ms client overhead/message, "
+              f"{messages / elapsed:7.1f} msgs/s concurrent, "
+              f"{gateway.stats['connections'] - connections:4d} TCP connections, "
+              f"{sum(not result.success for result in results)} failed")
+    gateway.stop()
+
+def incident_track(minutes=120):
+    # Stationary for an hour (GPS jitter only), walking at ~80 m/min for 30 minutes, stationary again
+    lat, lng = 52.52, 13.405
+    for minute in range(minutes):
+        if 60 <= minute < 90:
+            lat += 80 / 111320
+        yield lat + random.uniform(-4e-5, 4e-5), lng + random.uniform(-4e-5, 4e-5)
+
+def bench_location_sharing(minutes=120, contacts=3):
+    numbers = [f"+1555000{i:04d}" for i in range(contacts)]
+    session = LocationSharingSession()
+    session.start()
+    ticks = minutes * 60 // LOCATION_SHARING_INTERVAL
+    track = list(incident_track(minutes))
+    planned = []
+    for tick in range(ticks):
+        now = 1.6e9 + tick * LOCATION_SHARING_INTERVAL
+        planned.append(session.plan(track[tick * LOCATION_SHARING_INTERVAL // 60], numbers, now=now))
+
+    # The gateway is down for the whole incident: nothing drains, so the backlog is what
+    # would be sent (or retried) once it recovers
+    backlog = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for label, coalesce in (("naive", False), ("coalesced", True)):
+            outbox = AlertOutbox(SmsDispatcher(None, "+10000000000"), os.path.join(directory, f"{label}.db"))
+            outbox.stop()
+            for alert_id, recipients in planned:
+                outbox.enqueue("Real-time Location Update", recipients, alert_id=alert_id,
+                               supersedes=session.alert_prefix if coalesce else None)
+            backlog[label] = outbox.pending_count()
+            outbox.conn.close()
+
+    print(f"Location sharing over a {minutes}-minute incident, {contacts} contacts, {ticks} ticks:")
+    print(f"  one SMS per contact per tick   {ticks * contacts:5d} messages")
+    print(f"  LocationSharingSession         {session.stats['sent']:5d} messages "
+          f"({session.stats['unmoved']} unmoved, {session.stats['rate_limited']} rate limited)")
+    print(f"  backlog during an outage       {backlog['naive']:5d} queued -> {backlog['coalesced']} after coalescing")
+    sent_at = [tick for tick, (_, recipients) in enumerate(planned) if numbers[0] in recipients]
+    longest = max(b - a for a, b in zip(sent_at, sent_at[1:])) * LOCATION_SHARING_INTERVAL / 60
+    print(f"  longest gap between updates    {longest:5.0f} min")
+
+class FixedPolicy:
+    # The old tracker: a lookup every five minutes whatever happens
+    def observe(self, location, now=None):
+        pass
+
+    def next_interval(self, sos_active=False, battery=None):
+        return TRACKER_BASE_INTERVAL
+
+DAY = 24 * 3600
+METRES_PER_DEGREE = 111320
+
+def commuter_trace(t):
+    # Home until 8:00, 45 minutes commuting at 8 m/s, work until 17:30, commute back
+    if 8 * 3600 <= t < 8.75 * 3600:
+        return 52.52 + 8 * (t - 8 * 3600) / METRES_PER_DEGREE, 13.405
+    if 8.75 * 3600 <= t < 17.5 * 3600:
+        return 52.52 + 8 * 2700 / METRES_PER_DEGREE, 13.405
+    if 17.5 * 3600 <= t < 18.25 * 3600:
+        return 52.52 + 8 * (18.25 * 3600 - t) / METRES_PER_DEGREE, 13.405
+    return 52.52, 13.405
+
+def walker_trace(t):
+    return 52.52 + 1.4 * t / METRES_PER_DEGREE, 13.405
+
+def home_trace(t):
+    return 52.52, 13.405
+
+def simulate_tracker(policy, trace, sos=(None, None), battery=None, step=10):
+    # Returns (lookups, mean fix age, mean error in metres while moving)
+    sos_start, sos_end = sos
+    fixes = []
+    t = 0.0
+    while t < DAY:
+        fix = trace(t)
+        policy.observe(fix, t)
+        fixes.append((t, fix))
+        sos_active = sos_start is not None and sos_start <= t < sos_end
+        next_t = t + policy.next_interval(sos_active, battery)
+        if sos_start is not None and t < sos_start < next_t:
+            next_t = sos_start  # The tracker is woken when an SOS starts
+        t = next_t
+
+    ages, errors = [], []
+    index = 0
+    for now in range(0, DAY, step):
+        while index + 1 < len(fixes) and fixes[index + 1][0] <= now:
+            index += 1
+        fixed_at, fix = fixes[index]
+        ages.append(now - fixed_at)
+        if trace(now) != trace(now + step):
+            errors.append(haversine_m(fix[0], fix[1], *trace(now)))
+    return len(fixes), sum(ages) / len(ages), sum(errors) / len(errors) if errors else 0.0
+
+def bench_tracker_policy():
+    LowBattery = namedtuple("LowBattery", ["percent", "power_plugged"])
+    scenarios = [
+        ("at home all day", home_trace, (None, None), None),
+        ("commuter", commuter_trace, (None, None), None),
+        ("commuter, SOS 19:00-20:00", commuter_trace, (19 * 3600, 20 * 3600), None),
+        ("walking all day", walker_trace, (None, None), None),
+        ("commuter, 10% battery", commuter_trace, (None, None), LowBattery(10, False)),
+    ]
+    print("Location tracker over a simulated day (fixed 5 min vs adaptive):")
+    print(f"  {'trace':27s} {'lookups/day':>17s} {'mean fix age (s)':>19s} {'error moving (m)':>19s}")
+    for label, trace, sos, battery in scenarios:
+        fixed = simulate_tracker(FixedPolicy(), trace, sos, battery)
+        adaptive = simulate_tracker(TrackingPolicy(), trace, sos, battery)
+        print(f"  {label:27s} {fixed[0]:7d} -> {adaptive[0]:6d} {fixed[1]:8.0f} -> {adaptive[1]:6.0f} "
+              f"{fixed[2]:8.0f} -> {adaptive[2]:6.0f}")
+
+class SimulatedSource:
+    # Latency drawn uniformly from a range (in real seconds, scaled down for the run)
+    def __init__(self, name, latency, accuracy, fix_rate, scale):
+        self.name = name
+        self.latency = latency
+        self.accuracy = accuracy
+        self.fix_rate = fix_rate
+        self.scale = scale
+
+    def fix(self):
+        time.sleep(random.uniform(*self.latency) * self.scale)
+        if random.random() < self.fix_rate:
+            return LocationFix(52.52, 13.405, self.accuracy, self.name, time.time())
+        return None
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def bench_location_sources(trials=100, scale=0.05):
+    ip = SimulatedSource("ip", (0.3, 6.0), IP_LOCATION_ACCURACY, 0.95, scale)
+    gps = SimulatedSource("gps", (0.2, 2.0), 8, 0.7, scale)
+    print(f"SOS location lookup, {trials} trials (IP 0.3-6 s, GPS 0.2-2 s with a fix 70% of the time):")
+    for label, sources in (("IP geocoder only", [ip]), ("IP + GPS racing", [ip, gps])):
+        latencies, accuracies = [], []
+        for _ in range(trials):
+            chain = LocationSourceChain(sources)
+            started = time.perf_counter()
+            fix = chain.best_fix(SOS_LOCATION_BUDGET * scale)
+            latencies.append((time.perf_counter() - started) / scale)
+            accuracies.append(fix.accuracy if fix else None)
+            chain.executor.shutdown(wait=False)
+        located = [accuracy for accuracy in accuracies if accuracy is not None]
+        print(f"  {label:18s} p50 {percentile(latencies, 0.5):4.2f}s  max {max(latencies):4.2f}s  "
+              f"no fix {trials - len(located):3d}  GPS-grade fix {sum(a <= 20 for a in located):3d}")
+
+    # What the old path paid: wait for the IP lookup however long it takes
+    latencies = []
+    for _ in range(trials):
+        started = time.perf_counter()
+        ip.fix()
+        latencies.append((time.perf_counter() - started) / scale)
+    print(f"  {'unbounded IP':18s} p50 {percentile(latencies, 0.5):4.2f}s  max {max(latencies):4.2f}s")
+
+def brute_force_nearest(places, lat, lng, k):
+    return heapq.nsmallest(k, ((haversine_m(lat, lng, place_lat, place_lng), i)
+                               for i, (place_lat, place_lng) in enumerate(places)))
+
+def bench_safe_places(n=1000000, queries=1000, brute_queries=5, k=5, radius_m=2000):
+    # POIs spread over a Germany-sized box, roughly the density of an OSM extract's amenities
+    places = [(random.uniform(47.3, 55.0), random.uniform(5.9, 15.0)) for _ in range(n)]
+    started = time.perf_counter()
+    index = SafePlaceIndex()
+    for i, (lat, lng) in enumerate(places):
+        index.add(f"place {i}", "police", lat, lng)
+    build = time.perf_counter() - started
+    points = [(random.uniform(47.3, 55.0), random.uniform(5.9, 15.0)) for _ in range(queries)]
+
+    started = time.perf_counter()
+    for lat, lng in points:
+        index.nearest(lat, lng, k)
+    knn = (time.perf_counter() - started) / queries
+    started = time.perf_counter()
+    hits = sum(len(index.within(lat, lng, radius_m)) for lat, lng in points)
+    radius = (time.perf_counter() - started) / queries
+
+    mismatches = 0
+    started = time.perf_counter()
+    for lat, lng in points[:brute_queries]:
+        expected = [i for _, i in brute_force_nearest(places, lat, lng, k)]
+        got = [int(place.name.split()[1]) for _, place in index.nearest(lat, lng, k)]
+        mismatches += expected != got
+    brute = (time.perf_counter() - started) / brute_queries
+
+    print(f"Safe places, {n} POIs, {k} nearest / within {radius_m} m:")
+    print(f"  grid build         {build:8.2f} s")
+    print(f"  grid kNN           {1000 * knn:8.3f} ms/query")
+    print(f"  grid radius        {1000 * radius:8.3f} ms/query ({hits / queries:.1f} places on average)")
+    print(f"  brute-force kNN    {1000 * brute:8.1f} ms/query, {mismatches}/{brute_queries} answers differ from the grid")
+
+def random_fences(engine, n, centre, spread):
+    # Circles of 50-500 m and one square polygon in ten, within +-spread degrees of centre
+    for i in range(n):
+        lat, lng = centre[0] + random.uniform(-spread, spread), centre[1] + random.uniform(-spread, spread) * 1.6
+        if i % 10:
+            engine.add_circle(f"fence {i}", lat, lng, random.uniform(50, 500))
+        else:
+            d = random.uniform(0.001, 0.004)
+            engine.add_polygon(f"fence {i}", [(lat - d, lng - d), (lat - d, lng + d), (lat + d, lng + d), (lat + d, lng - d)])
+
+def bench_geofence(fixes=2000):
+    walk = [(52.5 + 1e-5 * i, 13.4 + 1e-5 * i) for i in range(fixes)]
+    print(f"Geofence evaluation over a {fixes}-fix walk:")
+    # All fences within a few km of the walk, so more fences means more of them near
+    # every fix: 1000 is a busy city, 100000 a worst case
+    for n in (1000, 10000, 100000):
+        engine = GeofenceEngine()
+        random_fences(engine, n, walk[fixes // 2], 0.05)
+        engine.update(*walk[0])  # Primes every fence
+        engine.evaluations = 0
+        events = 0
+        started = time.perf_counter()
+        for lat, lng in walk:
+            events += len(engine.update(lat, lng))
+        elapsed = (time.perf_counter() - started) / fixes
+        brute = None
+        if n <= 10000:
+            fences = list(engine.fences.values())
+            started = time.perf_counter()
+            for lat, lng in walk[:50]:
+                [fence for fence in fences if GeofenceEngine.signed_distance(fence, lat, lng) < 0]
+            brute = (time.perf_counter() - started) / 50
+        print(f"  {n:6d} fences  {1e6 * elapsed:7.1f} us/fix, {engine.evaluations / fixes:5.1f} fences tested/fix, "
+              f"{events} events" + (f"; testing every fence {1000 * brute:6.1f} ms/fix" if brute else ""))
+
+    # A user standing on the edge of a 150 m fence with 20 m GPS jitter for 8 hours at 30 s fixes
+    for label, engine in (("no hysteresis", GeofenceEngine(hysteresis=0, confirm=1)), ("hysteresis", GeofenceEngine())):
+        engine.add_circle("home", 52.5, 13.4, 150)
+        edge = 52.5 + 150 / 111195
+        events = sum(len(engine.update(edge + random.gauss(0, 20) / 111195, 13.4)) for _ in range(960))
+        print(f"  jitter at a fence edge, {label:13s} {events:4d} enter/exit events in 8 h")
+
+def realistic_fixes(n, interval=30):
+    # Alternating stays (GPS jitter only) and walks, with the odd wild fix
+    timestamps, lats, lngs = array('d'), array('d'), array('d')
+    lat, lng, t = 52.52, 13.405, 1.6e9
+    walking = False
+    for i in range(n):
+        if i % 120 == 0:
+            walking = not walking
+        if walking:
+            lat += 1.4 * interval / 111195
+        t += interval
+        timestamps.append(t)
+        if random.random() < 0.001:
+            lats.append(lat + 0.5)
+            lngs.append(lng)
+        else:
+            lats.append(lat + random.gauss(0, 5) / 111195)
+            lngs.append(lng + random.gauss(0, 5) / 68000)
+    return timestamps, lats, lngs
+
+def python_trajectory(timestamps, lats, lngs):
+    # The same analysis as analyse_trajectory, one fix at a time
+    def step(i, j):
+        distance = haversine_m(lats[i], lngs[i], lats[j], lngs[j])
+        dt = timestamps[j] - timestamps[i]
+        speed = distance / max(dt, 1e-3)
+        return distance, dt, speed, speed > TRAJECTORY_JUMP_SPEED and distance > TRAJECTORY_JUMP_MIN_DISTANCE
+
+    # First pass: drop bad fixes (jumped into and out of; the oldest or newest fix when
+    # the step beyond it is fine)
+    n = len(timestamps)
+    jumps = [step(i, i + 1)[3] for i in range(n - 1)]
+    kept = []
+    for i in range(n):
+        if i == 0:
+            bad = n > 2 and jumps[0] and not jumps[1]
+        elif i == n - 1:
+            bad = jumps[-1] and (n == 2 or not jumps[-2])
+        else:
+            bad = jumps[i - 1] and jumps[i]
+        if not bad:
+            kept.append(i)
+
+    distance = moving_time = max_speed = 0.0
+    dwells = 0
+    run = None
+    for k in range(len(kept) - 1):
+        length, dt, speed, jump = step(kept[k], kept[k + 1])
+        still = not jump and speed < TRAJECTORY_DWELL_SPEED
+        if not jump:
+            distance += length
+            max_speed = max(max_speed, speed)
+            if not still:
+                moving_time += dt
+        if still and run is None:
+            run = k
+        if run is not None and (not still or k == len(kept) - 2):
+            last = k + 1 if still else k
+            members = kept[run:last + 1]
+            if timestamps[members[-1]] - timestamps[members[0]] >= TRAJECTORY_DWELL_MIN_DURATION:
+                mean_lat = sum(lats[j] for j in members) / len(members)
+                mean_lng = sum(lngs[j] for j in members) / len(members)
+                if all(haversine_m(lats[j], lngs[j], mean_lat, mean_lng) <= TRAJECTORY_DWELL_RADIUS_M
+                       for j in members):
+                    dwells += 1
+            run = None
+    return distance, moving_time, max_speed, dwells, n - len(kept)
+
+def bench_trajectory(n=1000000):
+    timestamps, lats, lngs = realistic_fixes(n)
+    analyse_trajectory(timestamps[:10], lats[:10], lngs[:10])  # Import NumPy outside the timing
+    started = time.perf_counter()
+    stats = analyse_trajectory(timestamps, lats, lngs)
+    vectorised = time.perf_counter() - started
+    started = time.perf_counter()
+    distance, moving_time, max_speed, dwells, jumps = python_trajectory(timestamps, lats, lngs)
+    loop = time.perf_counter() - started
+    agree = (abs(distance - stats.distance_m) < 1e-6 * distance and dwells == len(stats.dwells)
+             and jumps == len(stats.jumps) and abs(moving_time - stats.moving_time) < 1e-6 * moving_time)
+    print(f"Trajectory analytics over {n} fixes:")
+    print(f"  NumPy        {vectorised:7.3f} s")
+    print(f"  Python loop  {loop:7.3f} s   results {'agree' if agree else 'DIFFER'}")
+    print(f"  {trajectory_summary(stats)}")
+
+BENCHMARKS = {
+    "history-memory": bench_history_memory,
+    "listener-silence": bench_listener_silence,
+    "intent-matcher": bench_intent_matcher,
+    "keyword-scanner": bench_keyword_scanner,
+    "audio-startup": bench_audio_startup,
+    "outbox-drain": bench_outbox_drain,
+    "sms-transport": bench_sms_transport,
+    "location-sharing": bench_location_sharing,
+    "tracker-policy": bench_tracker_policy,
+    "location-sources": bench_location_sources,
+    "safe-places": bench_safe_places,
+    "geofence": bench_geofence,
+    "trajectory": bench_trajectory,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    failed = []
+    for name in names:
+        started = time.perf_counter()
+        try:
+            BENCHMARKS[name]()
+        except AssertionError as e:
+            # Correctness checks fail the run; the remaining benchmarks still go ahead
+            print(f"[{name}] FAILED: {e}\n")
+            failed.append(name)
+            continue
+        print(f"[{name}] finished in {time.perf_counter() - started:.1f}s\n")
+    sys.exit(1 if failed else 0)
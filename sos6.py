@@ -1,75 +1,2263 @@
 import sys
+import time
 import json
 import os
-import time
+import sqlite3
+import importlib
+import math
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
-import pyaudio
+from contextlib import contextmanager
 import wave
 import threading
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLineEdit, QLabel, QVBoxLayout, QHBoxLayout,
-                             QWidget, QMessageBox, QProgressBar, QListWidget, QTabWidget, QComboBox, QTextEdit,
-                             QInputDialog, QDialog, QStyleFactory, QListWidgetItem)
-from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal, QUrl
-from PyQt5.QtGui import QIcon, QFont, QDesktopServices
-from PyQt5.QtWebEngineWidgets import QWebEngineView
-import geocoder
-from twilio.rest import Client
-import folium
-import schedule
-import requests
-import speech_recognition as sr
-import pyttsx3
-import phonenumbers
-import webbrowser
-import psutil  # For battery monitoring
+import queue
+import itertools
+import re
+import heapq
+import random
+import uuid
+import socket
+import bz2
+from functools import reduce
+from array import array
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.etree import ElementTree
+
+class StartupProfiler:
+    # Collects how long each startup component takes, relative to process start
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.entries = []
+
+    @contextmanager
+    def measure(self, component):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(component, time.perf_counter() - started)
+
+    def record(self, component, duration):
+        with self.lock:
+            self.entries.append((time.perf_counter() - self.started, component, duration))
+
+    def mark(self, milestone):
+        self.record(milestone, None)
+
+    def report(self):
+        with self.lock:
+            entries = sorted(self.entries)
+        lines = ["Startup report (ms since launch / duration):"]
+        for at, component, duration in entries:
+            took = "" if duration is None else f"{1000 * duration:8.1f} ms  "
+            lines.append(f"  {1000 * at:8.1f} ms  {took:12}{component}")
+        print("\n".join(lines))
+
+startup_profiler = StartupProfiler()
+
+with startup_profiler.measure("import PyQt5"):
+    from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLineEdit, QLabel, QVBoxLayout, QHBoxLayout,
+                                 QWidget, QMessageBox, QProgressBar, QListWidget, QTabWidget, QComboBox, QTextEdit,
+                                 QInputDialog, QDialog, QStyleFactory, QListWidgetItem, QCheckBox)
+    from PyQt5.QtCore import QCoreApplication, QObject, QTimer, Qt, QThread, pyqtSignal, pyqtSlot, QUrl
+    from PyQt5.QtGui import QIcon, QFont, QDesktopServices
+
+class LazyModule:
+    # Stands in for a heavy module and imports it on first attribute access, so the
+    # window can be shown before the map, SMS, speech and audio stacks are loaded.
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with startup_profiler.measure(f"import {self._name}"):
+                        self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+pyaudio = LazyModule("pyaudio")
+geocoder = LazyModule("geocoder")
+twilio_rest = LazyModule("twilio.rest")
+twilio_http = LazyModule("twilio.http.http_client")
+requests = LazyModule("requests")
+requests_adapters = LazyModule("requests.adapters")
+folium = LazyModule("folium")
+folium_plugins = LazyModule("folium.plugins")
+sr = LazyModule("speech_recognition")
+pyttsx3 = LazyModule("pyttsx3")
+phonenumbers = LazyModule("phonenumbers")
+psutil = LazyModule("psutil")  # For battery monitoring
+vosk = LazyModule("vosk")  # Optional: offline streaming speech recognition
+numpy = LazyModule("numpy")  # Trajectory analytics
+
+SMS_MAX_WORKERS = 8  # Upper bound on concurrent outbound SMS requests
+SMS_HTTP_TIMEOUT = 15
+MOCK_GATEWAY_LATENCY = 0.05
+
+DeliveryResult = namedtuple("DeliveryResult", ["contact", "success", "error", "latency"])
+
+class DispatchReport:
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def success(self):
+        return all(result.success for result in self.results)
+
+    @property
+    def failed_contacts(self):
+        return [result.contact for result in self.results if not result.success]
+
+    @property
+    def time_to_last_delivery(self):
+        return max((result.latency for result in self.results), default=0.0)
+
+    def summary(self):
+        delivered = len(self.results) - len(self.failed_contacts)
+        return (f"Delivered {delivered}/{len(self.results)} messages, "
+                f"last delivery after {self.time_to_last_delivery:.2f}s")
+
+def pooled_adapter(pool_size):
+    # One keep-alive connection per sender thread instead of requests' default of 10
+    return requests_adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+# SMS transports share one interface: connect() builds the client up front (the startup
+# warm-up calls it so the first alert doesn't pay for it), send() delivers one message
+# or raises, close() releases the connections.
+class TwilioTransport:
+    def __init__(self, account_sid, auth_token, pool_size=SMS_MAX_WORKERS):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.pool_size = pool_size
+        self._client = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self._client is None:
+            with self.lock:
+                if self._client is None:
+                    # A single pooled session keeps TLS connections to the API alive between messages
+                    http_client = twilio_http.TwilioHttpClient(pool_connections=True, timeout=SMS_HTTP_TIMEOUT)
+                    http_client.session.mount("https://", pooled_adapter(self.pool_size))
+                    self._client = twilio_rest.Client(self.account_sid, self.auth_token, http_client=http_client)
+        return self._client
+
+    def send(self, body, from_, to):
+        self.connect().messages.create(body=body, from_=from_, to=to)
+
+    def close(self):
+        if self._client is not None:
+            self._client.http_client.session.close()
+
+class HttpGatewayTransport:
+    # Posts Twilio-style form fields (To, From, Body) to a plain HTTP gateway such as MockSmsGateway.
+    # pooled=False opens a new connection per message, which is what the benchmark compares against.
+    def __init__(self, url, pooled=True, pool_size=SMS_MAX_WORKERS):
+        self.url = url
+        self.pooled = pooled
+        self.pool_size = pool_size
+        self.session = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.session is None:
+            with self.lock:
+                if self.session is None:
+                    session = requests.Session()
+                    session.mount("http://", pooled_adapter(self.pool_size))
+                    session.mount("https://", pooled_adapter(self.pool_size))
+                    self.session = session
+        return self.session
+
+    def send(self, body, from_, to):
+        data = {"To": to, "From": from_, "Body": body}
+        if self.pooled:
+            response = self.connect().post(self.url, data=data, timeout=SMS_HTTP_TIMEOUT)
+        else:
+            response = requests.post(self.url, data=data, timeout=SMS_HTTP_TIMEOUT)
+        response.raise_for_status()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+class MockSmsGateway:
+    # Local stand-in for an SMS provider's HTTP API, for offline load tests and benchmarks.
+    # Every POST waits `latency` seconds and a fraction `error_rate` of them fail with 503.
+    def __init__(self, latency=MOCK_GATEWAY_LATENCY, error_rate=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.stats = {"connections": 0, "messages": 0, "errors": 0}
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+            def setup(self):
+                super().setup()
+                gateway.count("connections")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(gateway.latency)
+                if random.random() < gateway.error_rate:
+                    status, payload = 503, {"message": "Simulated gateway error"}
+                    gateway.count("errors")
+                else:
+                    status, payload = 201, {"sid": "SM" + uuid.uuid4().hex, "status": "queued"}
+                    gateway.count("messages")
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/Messages.json"
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="mock-sms-gateway")
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class SmsDispatcher:
+    # Fans a message out to every contact concurrently through a bounded thread pool
+    def __init__(self, transport, from_number, max_workers=SMS_MAX_WORKERS):
+        self.transport = transport
+        self.from_number = from_number
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sms")
+
+    def send_batch(self, messages):
+        # messages: (body, contact) pairs, sent concurrently; results come back in the same order
+        start = time.monotonic()
+        futures = [self.executor.submit(self._send_one, body, contact, start) for body, contact in messages]
+        return [future.result() for future in futures]
+
+    def send_async(self, message, contact, callback):
+        # callback(DeliveryResult) runs on a sender thread once the attempt is over
+        future = self.executor.submit(self._send_one, message, contact, time.monotonic())
+        future.add_done_callback(lambda future: callback(future.result()))
+
+    def _send_one(self, message, contact, start):
+        try:
+            self.transport.send(message, self.from_number, contact)
+            return DeliveryResult(contact, True, None, time.monotonic() - start)
+        except Exception as e:
+            return DeliveryResult(contact, False, str(e), time.monotonic() - start)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.transport.close()
+
+ALERT_PRIORITY_EMERGENCY = 0  # SOS and panic alerts jump ahead of routine jobs
+ALERT_PRIORITY_NORMAL = 1
+ALERT_PRIORITY_BACKGROUND = 2
+ALERT_QUEUE_WORKERS = 2
+
+class AlertJobQueue(QObject):
+    # Owns all outbound I/O (geocoding, SMS). The UI only submits jobs and gets
+    # the result back on the GUI thread through job_finished.
+    job_finished = pyqtSignal(object, object)
+
+    def __init__(self, workers=ALERT_QUEUE_WORKERS):
+        super().__init__()
+        self.jobs = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.job_finished.connect(self._deliver_result)
+        self.workers = [threading.Thread(target=self._work, daemon=True, name=f"alert-worker-{i}")
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, job, *args, on_done=None, priority=ALERT_PRIORITY_NORMAL):
+        self.jobs.put((priority, next(self.sequence), job, args, on_done))
+
+    def _work(self):
+        while True:
+            _, _, job, args, on_done = self.jobs.get()
+            if job is None:
+                break
+            try:
+                result = job(*args)
+            except Exception as e:
+                print(f"Alert job {getattr(job, '__name__', job)} failed: {str(e)}")
+                result = None
+            if on_done is not None:
+                self.job_finished.emit(on_done, result)
+
+    def post(self, on_done, result):
+        # Runs on_done(result) on the GUI thread, from any thread
+        self.job_finished.emit(on_done, result)
+
+    @pyqtSlot(object, object)
+    def _deliver_result(self, on_done, result):
+        on_done(result)
+
+    def stop(self):
+        # Sentinels sort after every queued job so pending alerts still go out
+        for _ in self.workers:
+            self.jobs.put((ALERT_PRIORITY_BACKGROUND + 1, next(self.sequence), None, (), None))
+
+LOCATION_CACHE_TTL = 60  # Seconds a fix is served without a new lookup
+LOCATION_STALE_LIMIT = 15 * 60  # Seconds an old fix may still be served while it is refreshed
+
+class LocationService:
+    # Shared front-end for geocoder lookups: a TTL cache, a single in-flight lookup
+    # shared by concurrent callers, and stale-while-revalidate so alerts never wait
+    # on a round-trip when a recent fix exists.
+    def __init__(self, lookup=None, ttl=LOCATION_CACHE_TTL, stale_limit=LOCATION_STALE_LIMIT):
+        self.lookup = lookup or self.geocode
+        self.ttl = ttl
+        self.stale_limit = stale_limit
+        self.lock = threading.Lock()
+        self.location = None
+        self.fetched_at = 0.0
+        self.in_flight = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookups = 0
+
+    @staticmethod
+    def geocode():
+        return geocoder.ip('me').latlng
+
+    def get(self, max_age=None, allow_stale=True):
+        max_age = self.ttl if max_age is None else max_age
+        with self.lock:
+            age = time.monotonic() - self.fetched_at
+            if self.location and age <= max_age:
+                self.hits += 1
+                return self.location
+            if allow_stale and self.location and age <= self.stale_limit:
+                self.stale_hits += 1
+                event, leader = self._join_lookup()
+                if leader:
+                    threading.Thread(target=self._run_lookup, args=(event,), daemon=True).start()
+                return self.location
+            self.misses += 1
+            event, leader = self._join_lookup()
+        if leader:
+            self._run_lookup(event)
+        else:
+            event.wait()
+        with self.lock:
+            return self.location
+
+    def peek(self):
+        with self.lock:
+            return self.location
+
+    def fresh(self):
+        # The cached fix if it is within the TTL, without ever starting a lookup
+        with self.lock:
+            if self.location and time.monotonic() - self.fetched_at <= self.ttl:
+                self.hits += 1
+                return self.location
+            return None
+
+    def store(self, location):
+        # A fix obtained elsewhere (e.g. the SOS path) refreshes the cache for everyone
+        with self.lock:
+            self.location = location
+            self.fetched_at = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                    "coalesced": self.coalesced, "lookups": self.lookups}
+
+    def _join_lookup(self):
+        # Caller must hold self.lock
+        if self.in_flight is None:
+            self.in_flight = threading.Event()
+            return self.in_flight, True
+        self.coalesced += 1
+        return self.in_flight, False
+
+    def _run_lookup(self, event):
+        try:
+            location = self.lookup()
+        except Exception as e:
+            print(f"Location lookup failed: {str(e)}")
+            location = None
+        with self.lock:
+            self.lookups += 1
+            if location:
+                self.location = location
+                self.fetched_at = time.monotonic()
+            self.in_flight = None
+        event.set()
+
+LOCATION_SOURCE_DEADLINE = 10  # Seconds a routine lookup waits for the sources
+SOS_LOCATION_BUDGET = 3  # Seconds an emergency alert waits for its best fix
+LOCATION_GOOD_ENOUGH = 20  # Metres; a fix this accurate ends the race early
+IP_LOCATION_ACCURACY = 5000  # IP geolocation is city-level at best
+GPS_UERE = 5.0  # Metres of error per unit of HDOP
+GPS_DEFAULT_ACCURACY = 15.0
+GPSD_PORT = 2947
+GPSD_TIMEOUT = 3
+
+LocationFix = namedtuple("LocationFix", ["lat", "lng", "accuracy", "source", "timestamp"])
+
+def nmea_coordinate(value, hemisphere):
+    # ddmm.mmmm / dddmm.mmmm to signed decimal degrees
+    dot = value.index(".")
+    degrees = float(value[:dot - 2]) + float(value[dot - 2:]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+def parse_nmea(line):
+    # (lat, lng, accuracy) from a GGA or RMC sentence carrying a valid fix, otherwise None
+    line = line.strip()
+    if not line.startswith("$") or "*" not in line:
+        return None
+    body, _, checksum = line[1:].partition("*")
+    try:
+        if reduce(lambda total, char: total ^ ord(char), body, 0) != int(checksum[:2], 16):
+            return None
+        fields = body.split(",")
+        kind = fields[0][2:]
+        if kind == "GGA" and len(fields) > 8 and fields[6] not in ("", "0"):
+            accuracy = float(fields[8]) * GPS_UERE if fields[8] else GPS_DEFAULT_ACCURACY
+            return nmea_coordinate(fields[2], fields[3]), nmea_coordinate(fields[4], fields[5]), accuracy
+        if kind == "RMC" and len(fields) > 6 and fields[2] == "A":
+            return nmea_coordinate(fields[3], fields[4]), nmea_coordinate(fields[5], fields[6]), GPS_DEFAULT_ACCURACY
+    except ValueError:
+        pass
+    return None
+
+# Location sources share one interface: a name and fix(), which returns a LocationFix,
+# None if there is no fix, or raises.
+class IpLocationSource:
+    name = "ip"
+
+    def fix(self):
+        latlng = geocoder.ip('me').latlng
+        if latlng:
+            return LocationFix(latlng[0], latlng[1], IP_LOCATION_ACCURACY, self.name, time.time())
+        return None
+
+class NmeaSocketSource:
+    # Reads NMEA from gpsd (asking it to stream raw sentences) or any TCP server that
+    # streams NMEA, until the first sentence with a valid fix
+    name = "gps"
+
+    def __init__(self, host="127.0.0.1", port=GPSD_PORT, timeout=GPSD_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def fix(self):
+        deadline = time.monotonic() + self.timeout
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            sock.sendall(b'?WATCH={"enable":true,"nmea":true};\n')
+            stream = sock.makefile("r", encoding="ascii", errors="replace")
+            while time.monotonic() < deadline:
+                line = stream.readline()
+                if not line:
+                    return None
+                parsed = parse_nmea(line)
+                if parsed:
+                    return LocationFix(*parsed, self.name, time.time())
+        return None
+
+class ReplayLocationSource:
+    # Replays a file of NMEA sentences or "lat,lng[,accuracy]" lines, one fix per call,
+    # wrapping around at the end. For demos and tests without a GPS receiver.
+    name = "replay"
+
+    def __init__(self, path, delay=0.0):
+        self.delay = delay
+        self.fixes = []
+        with open(path) as f:
+            for line in f:
+                parsed = parse_nmea(line) if line.startswith("$") else self.parse_plain(line)
+                if parsed:
+                    self.fixes.append(parsed)
+        self.position = itertools.cycle(range(len(self.fixes)))
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_plain(line):
+        try:
+            values = [float(value) for value in line.split(",")]
+        except ValueError:
+            return None
+        if len(values) == 2:
+            return values[0], values[1], GPS_DEFAULT_ACCURACY
+        if len(values) == 3:
+            return tuple(values)
+        return None
+
+    def fix(self):
+        if not self.fixes:
+            return None
+        time.sleep(self.delay)
+        with self.lock:
+            lat, lng, accuracy = self.fixes[next(self.position)]
+        return LocationFix(lat, lng, accuracy, self.name, time.time())
+
+class LocationSourceChain:
+    # Queries every source concurrently and returns the most accurate fix that arrives
+    # before the deadline. A source that is still busy from an earlier call isn't queried
+    # again; its pending answer counts for the new call instead.
+    def __init__(self, sources, deadline=LOCATION_SOURCE_DEADLINE, good_enough=LOCATION_GOOD_ENOUGH):
+        self.sources = sources
+        self.deadline = deadline
+        self.good_enough = good_enough
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(sources)), thread_name_prefix="location")
+
+    def best_fix(self, deadline=None):
+        ends = time.monotonic() + (self.deadline if deadline is None else deadline)
+        with self.lock:
+            pending = set()
+            for source in self.sources:
+                future = self.in_flight.get(source.name)
+                if future is None or future.done():
+                    future = self.in_flight[source.name] = self.executor.submit(self.query, source)
+                pending.add(future)
+        best = None
+        while pending:
+            remaining = ends - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                fix = future.result()
+                if fix and (best is None or fix.accuracy < best.accuracy):
+                    best = fix
+            if best and best.accuracy <= self.good_enough:
+                break
+        return best
+
+    def has_precise_source(self):
+        # Anything besides IP geolocation (GPS, replay) can beat a cached IP fix
+        return any(source.name != IpLocationSource.name for source in self.sources)
+
+    @staticmethod
+    def query(source):
+        try:
+            return source.fix()
+        except Exception as e:
+            print(f"Location source {source.name} failed: {str(e)}")
+            return None
+
+    def locate(self, deadline=None):
+        # [lat, lng] like the rest of the app uses, or None
+        fix = self.best_fix(deadline)
+        return [fix.lat, fix.lng] if fix else None
+
+def default_location_sources():
+    # IP geolocation always; gpsd when GPSD_HOST is set; a replay file when LOCATION_REPLAY_FILE is
+    sources = [IpLocationSource()]
+    if os.getenv('GPSD_HOST'):
+        sources.append(NmeaSocketSource(os.getenv('GPSD_HOST'), int(os.getenv('GPSD_PORT', GPSD_PORT))))
+    if os.getenv('LOCATION_REPLAY_FILE'):
+        sources.append(ReplayLocationSource(os.getenv('LOCATION_REPLAY_FILE')))
+    return LocationSourceChain(sources)
+
+USER_DATA_DB = 'user_data.db'
+LEGACY_USER_DATA_FILE = 'user_data.json'
+
+class UserDataStore:
+    # SQLite store: one row per profile field and one row per location fix, so a new
+    # fix is a single INSERT and a profile edit rewrites only the fields that changed.
+    # WAL journaling keeps every write atomic and crash-safe.
+    def __init__(self, path=USER_DATA_DB):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS profile (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS location_history ("
+                              "id INTEGER PRIMARY KEY, timestamp REAL NOT NULL, lat REAL NOT NULL, lng REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS location_history_timestamp ON location_history (timestamp)")
+        self.saved_fields = dict(self.conn.execute("SELECT key, value FROM profile"))
+
+    def is_empty(self):
+        return not self.saved_fields
+
+    def load_profile(self):
+        return {key: json.loads(value) for key, value in self.saved_fields.items()}
+
+    def save_profile(self, profile):
+        with self.lock:
+            changed = {}
+            for key, value in profile.items():
+                encoded = json.dumps(value)
+                if self.saved_fields.get(key) != encoded:
+                    changed[key] = encoded
+            if changed:
+                with self.conn:
+                    self.conn.executemany("INSERT OR REPLACE INTO profile (key, value) VALUES (?, ?)", changed.items())
+                self.saved_fields.update(changed)
+
+    def append_location(self, timestamp, location):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO location_history (timestamp, lat, lng) VALUES (?, ?, ?)",
+                              (timestamp, location[0], location[1]))
+
+    def load_location_columns(self, start=None, before=None, newest=None):
+        # Fixes with start <= timestamp < before, oldest first; newest=N keeps only the last N
+        query = "SELECT timestamp, lat, lng FROM location_history WHERE timestamp >= ? AND timestamp < ?"
+        params = [-math.inf if start is None else start, math.inf if before is None else before]
+        if newest is not None:
+            query = f"SELECT * FROM ({query} ORDER BY timestamp DESC LIMIT ?)"
+            params.append(newest)
+        # Rows stream straight into one flat array in C; no per-row Python code runs
+        with self.lock:
+            flat = array('d', itertools.chain.from_iterable(self.conn.execute(query + " ORDER BY timestamp", params)))
+        return flat[0::3], flat[1::3], flat[2::3]
+
+    def count_locations(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM location_history").fetchone()[0]
+
+    def nearest_location(self, timestamp):
+        with self.lock:
+            candidates = self.conn.execute(
+                "SELECT timestamp, lat, lng FROM (SELECT * FROM location_history WHERE timestamp <= ? ORDER BY timestamp DESC LIMIT 1) "
+                "UNION ALL SELECT timestamp, lat, lng FROM (SELECT * FROM location_history WHERE timestamp >= ? ORDER BY timestamp LIMIT 1)",
+                (timestamp, timestamp)).fetchall()
+        return min(candidates, key=lambda row: abs(row[0] - timestamp), default=None)
+
+    def import_legacy_json(self, path=LEGACY_USER_DATA_FILE):
+        # One-off migration from the old whole-file JSON format
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        history = data.pop("location_history", [])
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO location_history (timestamp, lat, lng) VALUES (?, ?, ?)",
+                                  [(entry["timestamp"], entry["location"][0], entry["location"][1])
+                                   for entry in history if entry.get("location")])
+        self.save_profile(data)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+EARTH_RADIUS_M = 6371008.8
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def simplify_track(lats, lngs, tolerance_m):
+    # Iterative Douglas-Peucker on a local equirectangular projection; returns kept indices
+    n = len(lats)
+    if n < 3:
+        return list(range(n))
+    scale = math.radians(1) * EARTH_RADIUS_M
+    x_scale = scale * math.cos(math.radians(sum(lats) / n))
+    xs = [lng * x_scale for lng in lngs]
+    ys = [lat * scale for lat in lats]
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance_m * tolerance_m
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        x1, y1 = xs[first], ys[first]
+        dx, dy = xs[last] - x1, ys[last] - y1
+        segment_sq = dx * dx + dy * dy
+        farthest, farthest_sq = -1, tolerance_sq
+        for i in range(first + 1, last):
+            px, py = xs[i] - x1, ys[i] - y1
+            if segment_sq:
+                t = min(1.0, max(0.0, (px * dx + py * dy) / segment_sq))
+                px -= t * dx
+                py -= t * dy
+            distance_sq = px * px + py * py
+            if distance_sq > farthest_sq:
+                farthest, farthest_sq = i, distance_sq
+        if farthest != -1:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [i for i in range(n) if keep[i]]
+
+Stop = namedtuple("Stop", ["lat", "lng", "arrived", "departed"])
+
+TRAJECTORY_DWELL_SPEED = 0.5  # m/s; slower steps count as staying put (walking is 1+ m/s)
+TRAJECTORY_DWELL_RADIUS_M = 150
+TRAJECTORY_DWELL_MIN_DURATION = 10 * 60
+TRAJECTORY_JUMP_SPEED = 70  # m/s (~250 km/h) implied between two fixes: a bad fix, not travel
+TRAJECTORY_JUMP_MIN_DISTANCE = 1000
+TRAJECTORY_SOS_WINDOW = 6 * 3600  # History an SOS message summarises
+
+TrajectoryStats = namedtuple("TrajectoryStats", ["fixes", "start", "end", "distance_m", "moving_time",
+                                                 "max_speed", "speeds", "dwells", "jumps"])
+
+def haversine_array(lat1, lng1, lat2, lng2):
+    phi1 = numpy.radians(lat1)
+    phi2 = numpy.radians(lat2)
+    a = (numpy.sin((phi2 - phi1) / 2) ** 2
+         + numpy.cos(phi1) * numpy.cos(phi2) * numpy.sin(numpy.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+def analyse_trajectory(timestamps, lats, lngs, dwell_speed=TRAJECTORY_DWELL_SPEED,
+                       dwell_radius_m=TRAJECTORY_DWELL_RADIUS_M, dwell_min_duration=TRAJECTORY_DWELL_MIN_DURATION,
+                       jump_speed=TRAJECTORY_JUMP_SPEED, jump_min_distance=TRAJECTORY_JUMP_MIN_DISTANCE):
+    # Vectorised passes over sorted columns (array('d'), lists or NumPy arrays).
+    # Steps implying an impossible speed are jumps. A bad fix is one reached by a jump and
+    # left by one; the oldest and newest fixes only have one step, so they are bad when it
+    # is a jump and the step beyond them is not. stats.jumps lists the bad fixes, and the
+    # rest of the analysis runs over the remaining fixes, so a bad fix is bridged by the
+    # step from the fix before it to the fix after it and does not split a dwell.
+    # stats.start, stats.end and stats.speeds cover those remaining fixes; a step that is
+    # still a jump is left out of distance and speed. A dwell is a run of slow steps
+    # lasting dwell_min_duration whose fixes all stay within dwell_radius_m of their mean;
+    # runs that drift further are not dwells.
+    t = numpy.asarray(timestamps, dtype=numpy.float64)
+    lat = numpy.asarray(lats, dtype=numpy.float64)
+    lng = numpy.asarray(lngs, dtype=numpy.float64)
+    n = len(t)
+    if n < 2:
+        start = float(t[0]) if n else None
+        return TrajectoryStats(n, start, start, 0.0, 0.0, 0.0, numpy.zeros(0), [], [])
+
+    def steps(t, lat, lng):
+        step = haversine_array(lat[:-1], lng[:-1], lat[1:], lng[1:])
+        dt = numpy.diff(t)
+        speeds = step / numpy.maximum(dt, 1e-3)  # Repeated timestamps shouldn't divide by zero
+        return step, dt, speeds, (speeds > jump_speed) & (step > jump_min_distance)
+
+    step, dt, speeds, jump = steps(t, lat, lng)
+    bad = numpy.zeros(n, dtype=bool)
+    bad[1:-1] = jump[:-1] & jump[1:]
+    bad[0] = jump[0] and n > 2 and not jump[1]
+    bad[-1] = jump[-1] and (n == 2 or not jump[-2])
+    jumps = [Fix(float(t[i]), float(lat[i]), float(lng[i])) for i in numpy.flatnonzero(bad)]
+    if jumps:
+        good = ~bad
+        t, lat, lng = t[good], lat[good], lng[good]
+        step, dt, speeds, jump = steps(t, lat, lng)
+    valid = ~jump
+    moving = valid & (speeds >= dwell_speed)
+
+    # Runs of slow steps: steps first..last-1 join fixes first..last
+    still = (valid & ~moving).astype(numpy.int8)
+    edges = numpy.diff(numpy.concatenate(([0], still, [0])))
+    first = numpy.flatnonzero(edges == 1)
+    last = numpy.flatnonzero(edges == -1)
+    keep = t[last] - t[first] >= dwell_min_duration
+    first, last = first[keep], last[keep]
+    dwells = []
+    if len(first):
+        counts = last - first + 1
+        lat_sums = numpy.concatenate(([0.0], numpy.cumsum(lat)))
+        lng_sums = numpy.concatenate(([0.0], numpy.cumsum(lng)))
+        mean_lat = (lat_sums[last + 1] - lat_sums[first]) / counts
+        mean_lng = (lng_sums[last + 1] - lng_sums[first]) / counts
+        offsets = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        run = numpy.repeat(numpy.arange(len(first)), counts)
+        members = first[run] + numpy.arange(counts.sum()) - offsets[run]
+        spread = haversine_array(lat[members], lng[members], mean_lat[run], mean_lng[run])
+        compact = numpy.maximum.reduceat(spread, offsets) <= dwell_radius_m
+        dwells = [Stop(float(a), float(b), float(t[i]), float(t[j]))
+                  for a, b, i, j in zip(mean_lat[compact], mean_lng[compact], first[compact], last[compact])]
+
+    return TrajectoryStats(n, float(t[0]), float(t[-1]), float(step[valid].sum()), float(dt[moving].sum()),
+                           float(speeds[valid].max()) if valid.any() else 0.0, speeds, dwells, jumps)
+
+def trajectory_summary(stats):
+    hours, minutes = divmod(int(stats.moving_time // 60), 60)
+    return (f"{stats.fixes} fixes, {stats.distance_m / 1000:.1f} km travelled, moving {hours}h {minutes:02d}m, "
+            f"top speed {stats.max_speed * 3.6:.0f} km/h, {len(stats.dwells)} stops, "
+            f"{len(stats.jumps)} bad fixes ignored")
+
+METRES_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+SAFE_PLACE_CELL_DEG = 0.01  # Grid cell edge; about 1.1 km north-south
+SAFE_PLACE_RESULTS = 5
+SAFE_PLACE_SEARCH_RADIUS_M = 50000
+SAFE_PLACES_OSM_FILE = os.getenv('SAFE_PLACES_OSM', 'safe_places.osm')
+SAFE_PLACE_TAGS = {
+    "amenity": {"police", "hospital", "fire_station", "clinic", "doctors", "pharmacy", "community_centre", "shelter"},
+    "emergency": {"ambulance_station", "emergency_ward_entrance"},
+}
+
+SafePlace = namedtuple("SafePlace", ["name", "category", "lat", "lng"])
+
+class SafePlaceIndex:
+    # Uniform lat/lng grid over columnar arrays. Queries scan square rings of cells outwards
+    # from the query point and stop as soon as no unscanned cell can hold anything closer
+    # than what was found; all distances are haversine. Not antimeridian-aware.
+    def __init__(self, cell_size=SAFE_PLACE_CELL_DEG):
+        self.cell_size = cell_size
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.names = []
+        self.categories = array('H')
+        self.category_names = []
+        self.category_ids = {}
+        self.cells = {}  # (row, col) -> array of place ids
+        self.rows = (0, -1)
+        self.cols = (0, -1)
+
+    def __len__(self):
+        return len(self.names)
+
+    def cell(self, lat, lng):
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def add(self, name, category, lat, lng):
+        place_id = len(self.names)
+        if category not in self.category_ids:
+            self.category_ids[category] = len(self.category_names)
+            self.category_names.append(category)
+        self.names.append(name)
+        self.categories.append(self.category_ids[category])
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        row, col = self.cell(lat, lng)
+        bucket = self.cells.get((row, col))
+        if bucket is None:
+            bucket = self.cells[(row, col)] = array('l')
+        bucket.append(place_id)
+        if place_id == 0:
+            self.rows, self.cols = (row, row), (col, col)
+        else:
+            self.rows = (min(self.rows[0], row), max(self.rows[1], row))
+            self.cols = (min(self.cols[0], col), max(self.cols[1], col))
+        return place_id
+
+    def place(self, place_id):
+        return SafePlace(self.names[place_id], self.category_names[self.categories[place_id]],
+                         self.lats[place_id], self.lngs[place_id])
+
+    @staticmethod
+    def ring(row, col, r):
+        if r == 0:
+            yield row, col
+            return
+        for c in range(col - r, col + r + 1):
+            yield row - r, c
+            yield row + r, c
+        for rr in range(row - r + 1, row + r):
+            yield rr, col - r
+            yield rr, col + r
+
+    def clearance(self, lat, lng, row, col, r):
+        # Lower bound in metres on the distance to any point outside rings 0..r
+        size = self.cell_size
+        north_south = min(lat - (row - r) * size, (row + r + 1) * size - lat) * METRES_PER_DEGREE
+        dlng = math.radians(min(lng - (col - r) * size, (col + r + 1) * size - lng))
+        if dlng >= math.pi / 2:
+            return north_south
+        # Shortest great-circle distance to a meridian dlng away
+        east_west = EARTH_RADIUS_M * math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(dlng)))
+        return min(north_south, east_west)
+
+    def nearest(self, lat, lng, k=SAFE_PLACE_RESULTS, max_distance=SAFE_PLACE_SEARCH_RADIUS_M):
+        # [(metres, SafePlace)] for the k nearest places within max_distance; k=None means all of them
+        found = []  # Max-heap on distance while k is set
+        if not self.names:
+            return found
+        lats, lngs, cells = self.lats, self.lngs, self.cells
+        row, col = self.cell(lat, lng)
+        r = 0
+        while True:
+            for key in self.ring(row, col, r):
+                bucket = cells.get(key)
+                if not bucket:
+                    continue
+                for place_id in bucket:
+                    distance = haversine_m(lat, lng, lats[place_id], lngs[place_id])
+                    if distance > max_distance:
+                        continue
+                    if k is None or len(found) < k:
+                        heapq.heappush(found, (-distance, place_id))
+                    elif distance < -found[0][0]:
+                        heapq.heapreplace(found, (-distance, place_id))
+            reach = self.clearance(lat, lng, row, col, r)
+            if reach >= max_distance or (k is not None and len(found) == k and -found[0][0] <= reach):
+                break
+            if (row - r <= self.rows[0] and row + r >= self.rows[1]
+                    and col - r <= self.cols[0] and col + r >= self.cols[1]):
+                break  # Every populated cell has been scanned
+            r += 1
+        return [(distance, self.place(place_id)) for distance, place_id in sorted((-d, i) for d, i in found)]
+
+    def within(self, lat, lng, radius_m):
+        return self.nearest(lat, lng, k=None, max_distance=radius_m)
+
+def load_osm_safe_places(path, index=None):
+    # Streams an OpenStreetMap XML extract (.osm or .osm.bz2), keeping nodes tagged as
+    # one of SAFE_PLACE_TAGS. Ways and relations (e.g. hospital outlines) are skipped.
+    index = index if index is not None else SafePlaceIndex()
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as f:
+        root = None
+        for event, elem in ElementTree.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == "node":
+                tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+                category = next((value for key, value in tags.items() if value in SAFE_PLACE_TAGS.get(key, ())), None)
+                if category:
+                    index.add(tags.get("name") or category.replace("_", " ").title(), category,
+                              float(elem.get("lat")), float(elem.get("lon")))
+            root.clear()  # Keeps memory flat however large the extract is
+    return index
+
+GEOFENCE_CELL_DEG = 0.01
+GEOFENCE_HYSTERESIS_M = 25  # A fix must be this far past a fence edge to count as crossing it...
+GEOFENCE_CONFIRM_FIXES = 2  # ...on this many consecutive fixes
+SAFE_LOCATION_RADIUS_M = 150
+SAFE_LOCATION_NIGHT_HOURS = (22, 6)  # Leaving a watched safe location between these hours escalates
+
+Geofence = namedtuple("Geofence", ["fence_id", "name", "lat", "lng", "radius", "polygon", "data"])
+GeofenceEvent = namedtuple("GeofenceEvent", ["kind", "fence", "timestamp"])
+
+def in_hours(hour, start, end):
+    # Whether hour falls in [start, end), which may wrap past midnight
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+def local_xy(lat0, lng0, lat, lng):
+    # Equirectangular metres around (lat0, lng0); accurate to well under a metre over a few km
+    return (math.radians(lng - lng0) * math.cos(math.radians(lat0)) * EARTH_RADIUS_M,
+            math.radians(lat - lat0) * EARTH_RADIUS_M)
+
+class GeofenceEngine:
+    # Circle and polygon fences registered in every grid cell their bounding circle touches,
+    # so a fix is only tested against the fences in its cell plus those it is inside;
+    # the cost per fix doesn't grow with the total number of fences. A crossing needs
+    # GEOFENCE_HYSTERESIS_M of margin on GEOFENCE_CONFIRM_FIXES consecutive fixes, which
+    # keeps GPS jitter at an edge from producing enter/exit storms. A fence's first
+    # evaluation only records which side the user is on.
+    def __init__(self, hysteresis=GEOFENCE_HYSTERESIS_M, confirm=GEOFENCE_CONFIRM_FIXES, cell_size=GEOFENCE_CELL_DEG):
+        self.hysteresis = hysteresis
+        self.confirm = confirm
+        self.cell_size = cell_size
+        self.fences = {}
+        self.cells = {}  # (row, col) -> set of fence ids
+        self.inside = set()
+        self.unprimed = set()
+        self.pending = {}  # fence id -> consecutive fixes on the other side
+        self.next_id = itertools.count()
+        self.evaluations = 0
+
+    def __len__(self):
+        return len(self.fences)
+
+    def add_circle(self, name, lat, lng, radius, data=None):
+        return self.add(Geofence(next(self.next_id), name, lat, lng, radius, None, data))
+
+    def add_polygon(self, name, vertices, data=None):
+        lat = sum(vertex[0] for vertex in vertices) / len(vertices)
+        lng = sum(vertex[1] for vertex in vertices) / len(vertices)
+        radius = max(haversine_m(lat, lng, vertex[0], vertex[1]) for vertex in vertices)
+        return self.add(Geofence(next(self.next_id), name, lat, lng, radius, list(vertices), data))
+
+    def add(self, fence):
+        self.fences[fence.fence_id] = fence
+        self.unprimed.add(fence.fence_id)
+        for key in self.fence_cells(fence):
+            self.cells.setdefault(key, set()).add(fence.fence_id)
+        return fence.fence_id
+
+    def remove(self, fence_id):
+        fence = self.fences.pop(fence_id)
+        for key in self.fence_cells(fence):
+            self.cells[key].discard(fence_id)
+            if not self.cells[key]:
+                del self.cells[key]
+        self.inside.discard(fence_id)
+        self.unprimed.discard(fence_id)
+        self.pending.pop(fence_id, None)
+
+    def fence_cells(self, fence):
+        reach = fence.radius + self.hysteresis
+        dlat = math.degrees(reach / EARTH_RADIUS_M)
+        dlng = dlat / max(math.cos(math.radians(min(89.0, abs(fence.lat) + dlat))), 1e-6)
+        size = self.cell_size
+        for row in range(math.floor((fence.lat - dlat) / size), math.floor((fence.lat + dlat) / size) + 1):
+            for col in range(math.floor((fence.lng - dlng) / size), math.floor((fence.lng + dlng) / size) + 1):
+                yield row, col
+
+    @staticmethod
+    def signed_distance(fence, lat, lng):
+        # Metres from the fence edge; negative inside
+        if fence.polygon is None:
+            return haversine_m(lat, lng, fence.lat, fence.lng) - fence.radius
+        points = [local_xy(lat, lng, vertex[0], vertex[1]) for vertex in fence.polygon]
+        inside = False
+        nearest = float("inf")
+        for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+            if (y1 > 0) != (y2 > 0) and 0 < x1 + (0 - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+            dx, dy = x2 - x1, y2 - y1
+            t = max(0.0, min(1.0, -(x1 * dx + y1 * dy) / (dx * dx + dy * dy))) if dx or dy else 0.0
+            nearest = min(nearest, math.hypot(x1 + t * dx, y1 + t * dy))
+        return -nearest if inside else nearest
+
+    def update(self, lat, lng, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        row, col = math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+        # Fences we're inside are always checked, so a jump far outside still exits them
+        candidates = self.cells.get((row, col), set()) | self.inside
+        events = []
+        for fence_id in candidates:
+            fence = self.fences[fence_id]
+            self.evaluations += 1
+            distance = self.signed_distance(fence, lat, lng)
+            if fence_id in self.unprimed:
+                self.unprimed.discard(fence_id)
+                if distance < 0:
+                    self.inside.add(fence_id)
+                continue
+            margin = min(self.hysteresis, fence.radius / 2)
+            was_inside = fence_id in self.inside
+            crossed = distance > margin if was_inside else distance < -margin
+            if not crossed:
+                self.pending.pop(fence_id, None)
+                continue
+            self.pending[fence_id] = self.pending.get(fence_id, 0) + 1
+            if self.pending[fence_id] >= self.confirm:
+                del self.pending[fence_id]
+                if was_inside:
+                    self.inside.discard(fence_id)
+                    events.append(GeofenceEvent("exit", fence, timestamp))
+                else:
+                    self.inside.add(fence_id)
+                    events.append(GeofenceEvent("enter", fence, timestamp))
+        # Fences that dropped out of the candidates can't be mid-crossing any more
+        for fence_id in [fence_id for fence_id in self.pending if fence_id not in candidates]:
+            del self.pending[fence_id]
+        # Unprimed fences away from the user are outside until shown otherwise
+        self.unprimed -= {fence_id for fence_id in self.unprimed if fence_id not in candidates}
+        return events
+
+HISTORY_MAX_TRACK_POINTS = 5000  # Fixes kept after decimation, before simplification
+HISTORY_SIMPLIFY_TOLERANCE_M = 25
+HISTORY_MAX_STOP_MARKERS = 1000
+HISTORY_RANGES = {
+    "Last 24 hours": 24 * 3600,
+    "Last 7 days": 7 * 24 * 3600,
+    "Last 30 days": 30 * 24 * 3600,
+    "All history": None,
+}
+
+class LocationHistoryRenderer:
+    # Draws the history as one simplified polyline plus clustered stop markers,
+    # so the generated page stays small no matter how many fixes are stored.
+    def __init__(self, max_track_points=HISTORY_MAX_TRACK_POINTS, tolerance_m=HISTORY_SIMPLIFY_TOLERANCE_M,
+                 max_stop_markers=HISTORY_MAX_STOP_MARKERS):
+        self.max_track_points = max_track_points
+        self.tolerance_m = tolerance_m
+        self.max_stop_markers = max_stop_markers
+
+    def render(self, timestamps, lats, lngs, path, start=None, end=None, summary=None, stops=(), jumps=()):
+        # timestamps must be sorted; returns the number of track points drawn.
+        # summary is shown in a box over the map; stops (Stop, e.g. the dwells from
+        # analyse_trajectory) get clustered markers and jumps (Fix) are marked as bad fixes.
+        lo = 0 if start is None else bisect_left(timestamps, start)
+        hi = len(timestamps) if end is None else bisect_right(timestamps, end)
+        if lo >= hi:
+            return 0
+
+        # Evenly spaced time buckets, always keeping the most recent fix
+        step = max(1, math.ceil((hi - lo) / self.max_track_points))
+        indices = list(range(lo, hi, step))
+        if indices[-1] != hi - 1:
+            indices.append(hi - 1)
+        ts = [timestamps[i] for i in indices]
+        la = [lats[i] for i in indices]
+        ln = [lngs[i] for i in indices]
+
+        track = [[la[i], ln[i]] for i in simplify_track(la, ln, self.tolerance_m)]
+        stops = [stop for stop in stops if stop.departed >= timestamps[lo] and stop.arrived <= timestamps[hi - 1]]
+        if summary and len(stops) > self.max_stop_markers:
+            summary += f" (newest {self.max_stop_markers} stops shown)"
+
+        m = folium.Map(location=track[-1], zoom_start=10)
+        if len(track) > 1:
+            folium.PolyLine(track, color="#0074D9", weight=3).add_to(m)
+            m.fit_bounds([[min(la), min(ln)], [max(la), max(ln)]])
+        cluster = folium_plugins.MarkerCluster(name="Stops").add_to(m)
+        for stop in stops[-self.max_stop_markers:]:
+            folium.Marker(
+                [stop.lat, stop.lng],
+                popup=f"{datetime.fromtimestamp(stop.arrived).strftime('%Y-%m-%d %H:%M')} - "
+                      f"{datetime.fromtimestamp(stop.departed).strftime('%Y-%m-%d %H:%M')}"
+            ).add_to(cluster)
+        for jump in jumps[-self.max_stop_markers:]:
+            folium.CircleMarker(
+                [jump.lat, jump.lng], radius=5, color="#FF851B",
+                popup=f"Ignored fix: {datetime.fromtimestamp(jump.timestamp).strftime('%Y-%m-%d %H:%M')}"
+            ).add_to(m)
+        if summary:
+            m.get_root().html.add_child(folium.Element(
+                '<div style="position: fixed; bottom: 20px; left: 20px; z-index: 1000; background: white; '
+                f'padding: 8px; border-radius: 5px; font-size: 13px;">{summary}</div>'))
+        folium.Marker(
+            track[-1],
+            popup=f"Latest: {datetime.fromtimestamp(ts[-1]).strftime('%Y-%m-%d %H:%M:%S')}",
+            icon=folium.Icon(color="red")
+        ).add_to(m)
+        m.save(path)
+        return len(track)
+
+Fix = namedtuple("Fix", ["timestamp", "lat", "lng"])
+
+LOCATION_HISTORY_WINDOW = 100000  # Most recent fixes kept in memory (~2.4 MB)
+
+class LocationHistory:
+    # Location fixes as sorted columnar arrays (8 bytes per value instead of a dict
+    # per fix). The timestamp column doubles as the index for range queries.
+    # Only the newest `window` fixes stay in memory; older ones are read back from
+    # the SQLite store when a query reaches past the in-memory window.
+    def __init__(self, store, window=LOCATION_HISTORY_WINDOW):
+        self.store = store
+        self.window = window
+        self.lock = threading.Lock()
+        self.total = store.count_locations()
+        self.timestamps, self.lats, self.lngs = store.load_location_columns(newest=window)
+
+    def __len__(self):
+        return self.total
+
+    def paged_out(self):
+        # Caller must hold self.lock
+        return self.total > len(self.timestamps)
+
+    def append(self, timestamp, location):
+        lat, lng = float(location[0]), float(location[1])
+        self.store.append_location(timestamp, (lat, lng))
+        with self.lock:
+            self.total += 1
+            if not self.timestamps or timestamp >= self.timestamps[-1]:
+                self.timestamps.append(timestamp)
+                self.lats.append(lat)
+                self.lngs.append(lng)
+            elif timestamp >= self.timestamps[0] or not self.paged_out():
+                i = bisect_right(self.timestamps, timestamp)
+                self.timestamps.insert(i, timestamp)
+                self.lats.insert(i, lat)
+                self.lngs.insert(i, lng)
+            self.trim()
+
+    def trim(self):
+        # Page out the oldest tenth of the window at once so trimming stays amortised O(1).
+        # Fixes sharing the boundary timestamp leave together, keeping the disk/memory split clean.
+        if len(self.timestamps) <= self.window + self.window // 10:
+            return
+        cut = bisect_right(self.timestamps, self.timestamps[len(self.timestamps) - self.window - 1])
+        del self.timestamps[:cut]
+        del self.lats[:cut]
+        del self.lngs[:cut]
+
+    def latest(self):
+        with self.lock:
+            if not self.timestamps:
+                return None
+            return Fix(self.timestamps[-1], self.lats[-1], self.lngs[-1])
+
+    def between(self, start=None, end=None):
+        # Columns (timestamps, lats, lngs) for fixes with start <= timestamp <= end
+        with self.lock:
+            lo = 0 if start is None else bisect_left(self.timestamps, start)
+            hi = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+            columns = self.timestamps[lo:hi], self.lats[lo:hi], self.lngs[lo:hi]
+            if not self.paged_out() or (start is not None and self.timestamps and start >= self.timestamps[0]):
+                return columns
+            boundary = self.timestamps[0] if self.timestamps else math.inf
+        before = boundary if end is None else min(boundary, math.nextafter(end, math.inf))
+        older = self.store.load_location_columns(start=start, before=before)
+        return tuple(old + recent for old, recent in zip(older, columns))
+
+    def last(self, n):
+        with self.lock:
+            lo = max(0, len(self.timestamps) - n)
+            columns = self.timestamps[lo:], self.lats[lo:], self.lngs[lo:]
+            missing = n - len(self.timestamps)
+            if missing <= 0 or not self.paged_out():
+                return columns
+            boundary = self.timestamps[0] if self.timestamps else math.inf
+        older = self.store.load_location_columns(before=boundary, newest=missing)
+        return tuple(old + recent for old, recent in zip(older, columns))
+
+    def nearest(self, timestamp):
+        with self.lock:
+            if self.paged_out() and (not self.timestamps or timestamp < self.timestamps[0]):
+                row = self.store.nearest_location(timestamp)
+                return Fix(*row) if row else None
+            i = bisect_left(self.timestamps, timestamp)
+            if i == len(self.timestamps) or (i > 0 and timestamp - self.timestamps[i - 1] <= self.timestamps[i] - timestamp):
+                i -= 1
+            if i < 0:
+                return None
+            return Fix(self.timestamps[i], self.lats[i], self.lngs[i])
+
+SCHEDULER_MAX_SLEEP = 15 * 60  # Re-check the wall clock at least this often (suspend, clock changes)
+CHECK_IN_MISSED_GRACE = 6 * 3600  # Check-ins missed while the app was closed still go out up to this late
+
+class CheckInScheduler:
+    # One-shot timers kept in a heap. The worker sleeps until the earliest due job
+    # instead of polling; adding a job is O(log n) and cancelling marks it dead so
+    # it is dropped when it reaches the top of the heap.
+    def __init__(self):
+        self.heap = []
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="check-in-scheduler")
+        self.thread.start()
+
+    def schedule_at(self, due, callback, *args):
+        # due is a POSIX timestamp; returns an id for cancel()
+        with self.condition:
+            job_id = next(self.ids)
+            entry = [due, job_id, callback, args]
+            self.jobs[job_id] = entry
+            heapq.heappush(self.heap, entry)
+            if self.heap[0] is entry:
+                self.condition.notify()
+            return job_id
+
+    def cancel(self, job_id):
+        with self.condition:
+            entry = self.jobs.pop(job_id, None)
+            if entry is not None:
+                entry[2] = None
+                # Rebuild once dead entries dominate so the heap stays proportional to live jobs
+                if len(self.heap) > 2 * len(self.jobs) + 16:
+                    self.heap = [entry for entry in self.heap if entry[2] is not None]
+                    heapq.heapify(self.heap)
+            return entry is not None
+
+    def pending(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def run(self):
+        with self.condition:
+            while self.running:
+                while self.heap and self.heap[0][2] is None:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                delay = self.heap[0][0] - time.time()
+                if delay > 0:
+                    self.condition.wait(min(delay, SCHEDULER_MAX_SLEEP))
+                    continue
+                _, job_id, callback, args = heapq.heappop(self.heap)
+                del self.jobs[job_id]
+                self.condition.release()
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"Scheduled job {job_id} failed: {str(e)}")
+                finally:
+                    self.condition.acquire()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_BASE_DELAY = 2.0  # Seconds before the first retry; doubles per attempt
+OUTBOX_MAX_DELAY = 300.0
+OUTBOX_RETENTION = 30 * 24 * 3600  # Delivered rows are kept this long for reference
+OUTBOX_MAX_AGE = 6 * 3600  # Undelivered rows older than this at startup are marked expired, not sent
+OUTBOX_LATE_NOTICE = 5 * 60  # Messages going out later than this say when they were raised
+
+class AlertOutbox:
+    # Durable delivery queue: every (alert, contact) pair is a row in SQLite keyed by an
+    # idempotency key, so re-enqueueing is harmless and undelivered alerts survive a
+    # restart. A worker thread hands due rows to the SMS dispatcher one at a time as
+    # sender threads free up, most urgent priority first, and retries failures with
+    # exponential backoff and jitter. Delivery is at-least-once: a crash between sending
+    # and recording the result resends that one message. Rows left over from a previous
+    # run are only resent while they are recent, and say how late they are.
+    def __init__(self, dispatcher, path=USER_DATA_DB, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 base_delay=OUTBOX_BASE_DELAY, max_delay=OUTBOX_MAX_DELAY):
+        self.dispatcher = dispatcher
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.tracked = {}  # alert_id -> (enqueued at, contacts, {contact: first DeliveryResult}, callback)
+        self.max_in_flight = dispatcher.max_workers
+        self.in_flight = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS outbox ("
+                              "id INTEGER PRIMARY KEY, idempotency_key TEXT NOT NULL UNIQUE, alert_id TEXT NOT NULL, "
+                              "contact TEXT NOT NULL, body TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', "
+                              "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, created REAL NOT NULL, "
+                              "last_error TEXT, priority INTEGER NOT NULL DEFAULT 1)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, priority, next_attempt)")
+            # Rows claimed by a worker that never finished (crash, forced quit) go out again
+            self.conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+            # Location updates from an earlier sharing session are only noise now
+            self.conn.execute("DELETE FROM outbox WHERE status = 'pending' AND alert_id LIKE ?",
+                              (LOCATION_SHARING_ID_PREFIX + "%",))
+            self.conn.execute("UPDATE outbox SET status = 'expired' WHERE status = 'pending' AND created < ?",
+                              (time.time() - OUTBOX_MAX_AGE,))
+            self.conn.execute("DELETE FROM outbox WHERE status = 'sent' AND created < ?", (time.time() - OUTBOX_RETENTION,))
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="alert-outbox")
+        self.thread.start()
+
+    def enqueue(self, message, contacts, alert_id=None, priority=ALERT_PRIORITY_NORMAL, supersedes=None,
+                on_first_attempt=None):
+        # supersedes: alert_id prefix; still-pending older messages under it to the same
+        # contacts are dropped, so a backed-up queue only holds the newest one.
+        # on_first_attempt(DispatchReport) runs on a sender thread once every contact's
+        # first delivery attempt is over; nothing waits for it.
+        alert_id = alert_id or uuid.uuid4().hex
+        contacts = list(dict.fromkeys(contacts))
+        now = time.time()
+        with self.condition:
+            with self.conn:
+                if supersedes:
+                    self.conn.executemany(
+                        "DELETE FROM outbox WHERE status = 'pending' AND alert_id LIKE ? AND contact = ?",
+                        [(supersedes + "%", contact) for contact in contacts])
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (idempotency_key, alert_id, contact, body, next_attempt, created, priority) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(f"{alert_id}:{contact}", alert_id, contact, message, now, now, priority) for contact in contacts])
+            if on_first_attempt and contacts:
+                self.tracked[alert_id] = (time.monotonic(), contacts, {}, on_first_attempt)
+            self.condition.notify_all()
+        if on_first_attempt and not contacts:
+            on_first_attempt(DispatchReport([], 0.0))
+        return alert_id
+
+    def pending_count(self):
+        with self.condition:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    def backoff(self, attempts):
+        # Equal jitter: half the exponential delay is fixed, the other half random
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def run(self):
+        # Only claims as many rows as there are free sender threads, so a new SOS row is
+        # never stuck behind routine rows that were claimed before it arrived
+        with self.condition:
+            while self.running:
+                free = self.max_in_flight - self.in_flight
+                now = time.time()
+                rows = []
+                if free > 0:
+                    rows = self.conn.execute(
+                        "SELECT id, alert_id, contact, body, attempts, created FROM outbox "
+                        "WHERE status = 'pending' AND next_attempt <= ? ORDER BY priority, next_attempt LIMIT ?",
+                        (now, free)).fetchall()
+                if not rows:
+                    next_due = None
+                    if free > 0:
+                        next_due = self.conn.execute(
+                            "SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()[0]
+                    # A finished send or a new row notifies us
+                    self.condition.wait(None if next_due is None else max(0.0, next_due - now))
+                    continue
+                with self.conn:
+                    self.conn.executemany("UPDATE outbox SET status = 'sending' WHERE id = ?", [(row[0],) for row in rows])
+                self.in_flight += len(rows)
+                for row in rows:
+                    self.dispatcher.send_async(self.late_body(row[3], row[5], now), row[2],
+                                               lambda result, row=row: self.finish(row, result))
+
+    @staticmethod
+    def late_body(body, created, now):
+        # A delayed alert must not read as if it were happening right now
+        late = now - created
+        if late < OUTBOX_LATE_NOTICE:
+            return body
+        raised = datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M')
+        return f"[Delayed: raised {raised}, {late / 60:.0f} min ago] {body}"
+
+    def finish(self, row, result):
+        row_id, alert_id, contact, _, attempts, _ = row
+        attempts += 1
+        report = None
+        with self.condition:
+            if result.success:
+                update = ('sent', attempts, time.time(), None, row_id)
+            else:
+                status = 'failed' if attempts >= self.max_attempts else 'pending'
+                update = (status, attempts, time.time() + self.backoff(attempts), result.error, row_id)
+                print(f"Delivery to {contact} failed (attempt {attempts}): {result.error}")
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?", update)
+            if attempts == 1 and alert_id in self.tracked:
+                enqueued_at, contacts, first_results, callback = self.tracked[alert_id]
+                first_results[contact] = result._replace(latency=time.monotonic() - enqueued_at)
+                if len(first_results) == len(contacts):
+                    del self.tracked[alert_id]
+                    report = DispatchReport([first_results[contact] for contact in contacts],
+                                            time.monotonic() - enqueued_at)
+            self.in_flight -= 1
+            self.condition.notify_all()
+        if report:
+            callback(report)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+LOCATION_SHARING_INTERVAL = 60  # Seconds between location-sharing ticks
+LOCATION_SHARING_MIN_MOVEMENT = 50  # Metres moved before a contact gets a new update
+LOCATION_SHARING_HEARTBEAT = 900  # Stationary users still get an update this often
+LOCATION_SHARING_MAX_PER_HOUR = 20  # Per-contact rate of location-sharing SMS, spread evenly over the hour
+LOCATION_SHARING_BURST = 3  # Updates a contact can get back to back before the rate applies
+LOCATION_SHARING_ID_PREFIX = "share-"  # Outbox alert ids of location updates start with this
+
+class LocationSharingSession:
+    # Decides which contacts get a periodic location update. There is at most one session
+    # at a time; each contact only hears about real movement (or a periodic heartbeat).
+    # A per-contact token bucket allows a short burst and then one update every
+    # 3600 / max_per_hour seconds, so a long incident gets evenly spaced updates
+    # instead of a burst followed by silence.
+    def __init__(self, min_movement=LOCATION_SHARING_MIN_MOVEMENT, heartbeat=LOCATION_SHARING_HEARTBEAT,
+                 max_per_hour=LOCATION_SHARING_MAX_PER_HOUR, burst=LOCATION_SHARING_BURST):
+        self.min_movement = min_movement
+        self.heartbeat = heartbeat
+        self.max_per_hour = max_per_hour
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.active = False
+        self.session_id = None
+        self.sequence = 0
+        self.in_flight = False
+        self.last_sent = {}  # contact -> (time, lat, lng) of the last update planned for them
+        self.buckets = {}  # contact -> (tokens, time they were counted)
+        self.stats = {"sent": 0, "unmoved": 0, "rate_limited": 0, "coalesced": 0}
+
+    def start(self):
+        # False if a session is already running, so callers don't start a second timer
+        with self.lock:
+            if self.active:
+                return False
+            self.active = True
+            self.session_id = uuid.uuid4().hex
+            self.sequence = 0
+            self.in_flight = False
+            self.last_sent.clear()
+            self.buckets.clear()
+            return True
+
+    def stop(self):
+        with self.lock:
+            self.active = False
+
+    def begin_update(self):
+        # A tick while the previous update is still waiting on location or the queue is
+        # folded into that update rather than queued behind it
+        with self.lock:
+            if not self.active:
+                return False
+            if self.in_flight:
+                self.stats["coalesced"] += 1
+                return False
+            self.in_flight = True
+            return True
+
+    def end_update(self):
+        with self.lock:
+            self.in_flight = False
+
+    @property
+    def alert_prefix(self):
+        return f"{LOCATION_SHARING_ID_PREFIX}{self.session_id}-"
+
+    def plan(self, location, contacts, now=None):
+        # Returns (alert_id, contacts that should receive this update)
+        now = time.time() if now is None else now
+        lat, lng = location
+        recipients = []
+        with self.lock:
+            for contact in contacts:
+                last = self.last_sent.get(contact)
+                if (last and now - last[0] < self.heartbeat
+                        and haversine_m(last[1], last[2], lat, lng) < self.min_movement):
+                    self.stats["unmoved"] += 1
+                    continue
+                tokens, counted = self.buckets.get(contact, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - counted) * self.max_per_hour / 3600)
+                if tokens < 1:
+                    self.buckets[contact] = (tokens, now)
+                    self.stats["rate_limited"] += 1
+                    continue
+                self.buckets[contact] = (tokens - 1, now)
+                self.last_sent[contact] = (now, lat, lng)
+                recipients.append(contact)
+            self.stats["sent"] += len(recipients)
+            self.sequence += 1
+            return f"{self.alert_prefix}{self.sequence}", recipients
+
+TRACKER_SOS_INTERVAL = 10  # Seconds between fixes during an SOS
+TRACKER_MOVING_INTERVAL = 30
+TRACKER_BASE_INTERVAL = 300
+TRACKER_STATIONARY_MAX_INTERVAL = 1800  # Stationary polling backs off up to this
+TRACKER_LOW_BATTERY_INTERVAL = 1800
+TRACKER_LOW_BATTERY_PERCENT = 20
+TRACKER_MOVEMENT_THRESHOLD = 50  # Metres between consecutive fixes that count as moving...
+TRACKER_MOVING_SPEED = 0.5  # ...as does this speed in m/s, which catches walking between close fixes
+
+class TrackingPolicy:
+    # Chooses the delay before the next fix: fast during an SOS or while the last fixes
+    # show movement, doubling towards TRACKER_STATIONARY_MAX_INTERVAL while stationary,
+    # and slow on a low, unplugged battery (unless an SOS is active)
+    def __init__(self, movement_threshold=TRACKER_MOVEMENT_THRESHOLD):
+        self.movement_threshold = movement_threshold
+        self.last_fix = None
+        self.moving = False
+        self.stationary_interval = TRACKER_BASE_INTERVAL
+
+    def observe(self, location, now=None):
+        now = time.monotonic() if now is None else now
+        lat, lng = location
+        if self.last_fix:
+            distance = haversine_m(self.last_fix[1], self.last_fix[2], lat, lng)
+            elapsed = max(now - self.last_fix[0], 1e-6)
+            self.moving = distance >= self.movement_threshold or distance / elapsed >= TRACKER_MOVING_SPEED
+            if self.moving:
+                self.stationary_interval = TRACKER_BASE_INTERVAL
+            else:
+                self.stationary_interval = min(TRACKER_STATIONARY_MAX_INTERVAL, self.stationary_interval * 2)
+        self.last_fix = (now, lat, lng)
+
+    def next_interval(self, sos_active=False, battery=None):
+        if sos_active:
+            return TRACKER_SOS_INTERVAL
+        if battery and battery.percent < TRACKER_LOW_BATTERY_PERCENT and not battery.power_plugged:
+            return TRACKER_LOW_BATTERY_INTERVAL
+        if self.moving:
+            return TRACKER_MOVING_INTERVAL
+        return self.stationary_interval
 
 class LocationTracker(QThread):
     location_update = pyqtSignal(list)
 
+    def __init__(self, location_service, policy=None):
+        super().__init__()
+        self.location_service = location_service
+        self.policy = policy or TrackingPolicy()
+        self.condition = threading.Condition()
+        self.running = True
+        self.sos_active = False
+        self.lookups = 0
+
+    def set_sos_active(self, active):
+        # Wakes the tracker so an SOS gets a fresh fix right away
+        with self.condition:
+            if active != self.sos_active:
+                self.sos_active = active
+                self.condition.notify_all()
+
+    def battery(self):
+        try:
+            return psutil.sensors_battery()
+        except Exception:
+            return None
+
     def run(self):
-        while True:
-            location = geocoder.ip('me').latlng
-            self.location_update.emit(location)
-            time.sleep(300)  # Update every 5 minutes
+        interval = TRACKER_SOS_INTERVAL if self.sos_active else TRACKER_BASE_INTERVAL
+        while self.running:
+            # Never accept a cached fix older than half the polling interval
+            location = self.location_service.get(max_age=min(LOCATION_CACHE_TTL, interval / 2), allow_stale=False)
+            self.lookups += 1
+            if location:
+                self.policy.observe(location)
+                self.location_update.emit(location)
+            with self.condition:
+                sos_active = self.sos_active
+                interval = self.policy.next_interval(sos_active, self.battery())
+                deadline = time.monotonic() + interval
+                while self.running and self.sos_active == sos_active and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.wait(5000)  # Don't hang shutdown on a lookup in progress
+
+AUDIO_RATE = 16000  # Speech models work at 16 kHz; also a third of the old 44.1 kHz capture cost
+AUDIO_CHUNK = 1024
+AUDIO_SAMPLE_WIDTH = 2  # paInt16
+AUDIO_BUFFER_SECONDS = 30  # Most recent audio kept in memory for recognition
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', 'vosk-model')
+_vosk_model = None
+
+_vosk_lock = threading.Lock()
+
+def load_vosk_model():
+    # Loaded once and shared by every recorder; None when vosk or the model is unavailable
+    global _vosk_model
+    with _vosk_lock:
+        if _vosk_model is None and os.path.isdir(VOSK_MODEL_PATH):
+            try:
+                vosk.SetLogLevel(-1)
+            except ImportError:
+                return None
+            _vosk_model = vosk.Model(VOSK_MODEL_PATH)
+    return _vosk_model
+
+class AudioRingBuffer:
+    # Preallocated capture buffer. Capacity is a whole number of chunks so a chunk
+    # never wraps, letting write() hand back a zero-copy view of where it landed.
+    def __init__(self, seconds, rate=AUDIO_RATE, chunk=AUDIO_CHUNK, sample_width=AUDIO_SAMPLE_WIDTH):
+        self.chunk_bytes = chunk * sample_width
+        chunks = max(1, math.ceil(seconds * rate / chunk))
+        self.buffer = bytearray(chunks * self.chunk_bytes)
+        self.view = memoryview(self.buffer)
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, len(self.buffer))
+
+    def write(self, data):
+        start = self.written % len(self.buffer)
+        end = start + len(data)
+        self.view[start:end] = data
+        self.written += len(data)
+        return self.view[start:end]
+
+    def views(self):
+        # Retained audio, oldest first, as one or two views into the buffer
+        end = self.written % len(self.buffer)
+        if self.written <= len(self.buffer):
+            return [self.view[:self.written]]
+        return [self.view[end:], self.view[:end]]
+
+    def getvalue(self):
+        return b''.join(self.views())
+
+    def clear(self):
+        self.written = 0
+
+AUDIO_SESSION_QUEUE_SECONDS = 10  # Backlog a slow consumer may build before old frames are dropped
+AUDIO_STALL_TIMEOUT = 1.0  # No frames for this long means the input device needs recovering
+
+class CaptureSession:
+    # One consumer's view of the shared input stream
+    def __init__(self, manager):
+        self.manager = manager
+        self.frames = queue.Queue(maxsize=int(AUDIO_SESSION_QUEUE_SECONDS * AUDIO_RATE / AUDIO_CHUNK))
+        self.opened_at = time.monotonic()
+        self.first_frame_at = None
+
+    def push(self, data):
+        # Runs on the PortAudio callback thread
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+        try:
+            self.frames.put_nowait(data)
+        except queue.Full:
+            self.frames.get_nowait()
+            self.frames.put_nowait(data)
+
+    def read(self, size=AUDIO_CHUNK, timeout=AUDIO_STALL_TIMEOUT):
+        # Returns the next chunk, or None after a stall (the device is recovered first)
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            self.manager.recover(stalled=True)
+            return None
+
+    def close(self):
+        self.manager.release(self)
+
+class AudioDeviceManager:
+    # Owns the single PyAudio instance, a warm callback-mode input stream and the TTS
+    # engine for the whole app. Callers get capture sessions instead of opening devices,
+    # so an SOS recording starts from an already running stream.
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.audio = None
+        self.stream = None
+        self.sessions = []
+        self.tts_engine = None
+        self.opened_at = -math.inf
+        self.tts_lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.stream is None:
+                self.open_stream()
+
+    def open_stream(self):
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=AUDIO_RATE, input=True,
+                                      frames_per_buffer=AUDIO_CHUNK, stream_callback=self.on_audio)
+        self.opened_at = time.monotonic()
+
+    def detach_stream(self):
+        # Call with self.lock held. The detached stream must be closed after releasing
+        # the lock: stop_stream() waits for on_audio, which needs the lock too.
+        stream, audio = self.stream, self.audio
+        self.stream = None
+        self.audio = None
+        return stream, audio
+
+    @staticmethod
+    def close_stream(stream, audio):
+        for closer in (lambda: stream.stop_stream(), lambda: stream.close(), lambda: audio.terminate()):
+            try:
+                closer()
+            except Exception:
+                pass
+
+    def on_audio(self, in_data, frame_count, time_info, status):
+        with self.lock:
+            for session in self.sessions:
+                session.push(in_data)
+        return (None, pyaudio.paContinue)
+
+    def open_session(self):
+        self.recover()
+        with self.lock:
+            session = CaptureSession(self)
+            self.sessions.append(session)
+            return session
+
+    def release(self, session):
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+
+    def recover(self, stalled=False):
+        # Reinitialise PortAudio so unplugged or reset devices are picked up again.
+        # stalled: no frames arrived for AUDIO_STALL_TIMEOUT. A device can stop calling back
+        # while its stream still reports active, so the stream is then reopened anyway,
+        # unless another stalled session has only just reopened it.
+        with self.lock:
+            if self.stream is not None and self.stream.is_active() and (
+                    not stalled or time.monotonic() - self.opened_at < AUDIO_STALL_TIMEOUT):
+                return
+            print("Audio input stalled, reopening the input device")
+            stale = self.detach_stream()
+        if stale[0] is not None:
+            self.close_stream(*stale)
+        with self.lock:
+            if self.stream is not None:
+                return
+            try:
+                self.open_stream()
+                return
+            except Exception as e:
+                print(f"Failed to reopen audio input: {str(e)}")
+                stale = self.detach_stream()
+        self.close_stream(*stale)
+
+    def speak(self, text):
+        with self.tts_lock:
+            if self.tts_engine is None:
+                self.tts_engine = pyttsx3.init()
+            try:
+                self.tts_engine.say(text)
+                self.tts_engine.runAndWait()
+            except Exception as e:
+                print(f"Text to speech failed, reinitialising: {str(e)}")
+                self.tts_engine = None
+
+    def shutdown(self):
+        with self.lock:
+            self.sessions.clear()
+            stale = self.detach_stream()
+        if stale[0] is not None:
+            self.close_stream(*stale)
+
+class SessionStream:
+    # File-like view of a capture session for speech_recognition, which cannot handle a
+    # missing chunk: a stall reads as silence while the device is being recovered
+    def __init__(self, session):
+        self.session = session
+
+    def read(self, size):
+        data = self.session.read(size)
+        return data if data is not None else b"\0" * (size * AUDIO_SAMPLE_WIDTH)
+
+    def close(self):
+        self.session.close()
+
+_session_audio_source_class = None
+
+def SessionAudioSource(device_manager):
+    # Lets speech_recognition's listen() read from a capture session instead of sr.Microphone.
+    # The class derives from sr.AudioSource, so it is only built once speech_recognition is loaded.
+    global _session_audio_source_class
+    if _session_audio_source_class is None:
+        class _SessionAudioSource(sr.AudioSource):
+            def __init__(self, device_manager):
+                self.device_manager = device_manager
+                self.SAMPLE_RATE = AUDIO_RATE
+                self.SAMPLE_WIDTH = AUDIO_SAMPLE_WIDTH
+                self.CHUNK = AUDIO_CHUNK
+                self.stream = None
+
+            def __enter__(self):
+                self.stream = SessionStream(self.device_manager.open_session())
+                return self
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                self.stream.close()
+                self.stream = None
+
+        _session_audio_source_class = _SessionAudioSource
+    return _session_audio_source_class(device_manager)
+
+def tokenize(text):
+    # Unicode-aware words, so keyword lists in any space-separated language match whole words
+    return re.findall(r"\w+(?:'\w+)*", text.casefold())
+
+class KeywordScanner:
+    # Aho-Corasick automaton over word tokens. Built once per keyword list, it finds
+    # every single- or multi-word keyword in one linear pass over a transcript, and
+    # matching whole tokens means "help" no longer fires on "helpful".
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.keywords = []
+        for keyword in keywords:
+            words = tokenize(keyword)
+            if not words:
+                continue
+            state = 0
+            for word in words:
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            if not self.output[state]:
+                self.output[state].append(len(self.keywords))
+                self.keywords.append(keyword)
+        # Breadth-first failure links; each state inherits the outputs of its fallback
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for word, child in self.goto[state].items():
+                pending.append(child)
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def scan(self, text):
+        # Distinct keywords in order of first appearance
+        found, seen, state = [], set(), 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for word in tokenize(text):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for index in output[state]:
+                if index not in seen:
+                    seen.add(index)
+                    found.append(self.keywords[index])
+        return found
 
 class VoiceRecorder(QThread):
     finished = pyqtSignal(str)
+    # (new keywords, transcript so far, seconds from capturing the audio chunk to detection)
+    keyword_spotted = pyqtSignal(list, str, float)
 
-    def __init__(self, duration=10):
+    def __init__(self, device_manager, duration=10, keyword_scanner=None, triggered_at=None):
         super().__init__()
+        self.device_manager = device_manager
         self.duration = duration
-        self.audio = pyaudio.PyAudio()
-        self.stream = None
-        self.frames = []
+        self.keyword_scanner = keyword_scanner or KeywordScanner([])
+        self.triggered_at = time.monotonic() if triggered_at is None else triggered_at
+        self.spotted = set()
+        self.unreported = []
+        self.reported = False
+        self.ring = AudioRingBuffer(min(duration, AUDIO_BUFFER_SECONDS))
+
+    def spot_keywords(self, text, captured_at, final=False):
+        # The first keywords are reported straight away; anything spotted after that is
+        # held back and reported together once the recording ends, so one recording
+        # raises at most two alerts however many keywords (or partial results) it has
+        found = [keyword for keyword in self.keyword_scanner.scan(text) if keyword not in self.spotted]
+        self.spotted.update(found)
+        self.unreported.extend(found)
+        if self.unreported and (final or not self.reported):
+            self.reported = True
+            self.keyword_spotted.emit(self.unreported, text, time.monotonic() - captured_at)
+            self.unreported = []
 
     def run(self):
-        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=44100, input=True, frames_per_buffer=1024)
-        for _ in range(0, int(44100 / 1024 * self.duration)):
-            data = self.stream.read(1024)
-            self.frames.append(data)
-        self.stream.stop_stream()
-        self.stream.close()
-        self.audio.terminate()
+        model = load_vosk_model()
+        recognizer = vosk.KaldiRecognizer(model, AUDIO_RATE) if model else None
+        transcript = []
 
+        # The evidence recording is written chunk by chunk straight from the ring buffer
         wf = wave.open("emergency_audio.wav", 'wb')
         wf.setnchannels(1)
-        wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
-        wf.setframerate(44100)
-        wf.writeframes(b''.join(self.frames))
+        wf.setsampwidth(AUDIO_SAMPLE_WIDTH)
+        wf.setframerate(AUDIO_RATE)
+
+        session = self.device_manager.open_session()
+        chunks = 0
+        # Give up on a dead microphone instead of waiting for frames forever
+        deadline = time.monotonic() + self.duration + 5 * AUDIO_STALL_TIMEOUT
+        while chunks < int(AUDIO_RATE / AUDIO_CHUNK * self.duration) and time.monotonic() < deadline:
+            data = session.read()
+            if data is None:
+                continue
+            if chunks == 0:
+                print(f"First emergency audio frame {1000 * (session.first_frame_at - self.triggered_at):.0f} ms after trigger")
+            chunks += 1
+            captured_at = time.monotonic()
+            wf.writeframesraw(self.ring.write(data))
+            if recognizer:
+                # Feed every chunk as it arrives so keywords surface mid-recording
+                if recognizer.AcceptWaveform(data):
+                    transcript.append(json.loads(recognizer.Result())["text"])
+                    current = " ".join(transcript)
+                else:
+                    current = " ".join(transcript + [json.loads(recognizer.PartialResult())["partial"]])
+                self.spot_keywords(current, captured_at)
+        session.close()
         wf.close()
 
-        # Perform speech recognition
+        if recognizer:
+            transcript.append(json.loads(recognizer.FinalResult())["text"])
+            text = " ".join(part for part in transcript if part)
+            self.spot_keywords(text, time.monotonic(), final=True)
+            self.finished.emit(text or "Speech not recognized")
+            return
+
+        # Without an offline model fall back to recognising the whole clip online
+        captured_at = time.monotonic()
         r = sr.Recognizer()
-        with sr.AudioFile("emergency_audio.wav") as source:
-            audio = r.record(source)
+        audio = sr.AudioData(self.ring.getvalue(), AUDIO_RATE, AUDIO_SAMPLE_WIDTH)
         try:
             text = r.recognize_google(audio)
+            self.spot_keywords(text, captured_at, final=True)
             self.finished.emit(text)
         except sr.UnknownValueError:
             self.finished.emit("Speech not recognized")
         except sr.RequestError:
             self.finished.emit("Could not request results from speech recognition service")
 
+VAD_STRIDE = 4  # Look at every 4th sample; plenty for an energy gate
+VAD_MIN_RMS = 300  # int16 RMS below this is always treated as silence
+VAD_RATIO = 3.0  # Speech must be this much louder than the tracked noise floor
+VAD_HANGOVER_FRAMES = 10  # ~0.6 s of quiet ends a speech segment
+VAD_PREROLL_FRAMES = 4  # Frames before the onset handed to the recognizer too
+LISTENER_MAX_SEGMENT_SECONDS = 8
+LISTENER_MAX_SEGMENT_FRAMES = math.ceil(LISTENER_MAX_SEGMENT_SECONDS * AUDIO_RATE / AUDIO_CHUNK)
+LISTENER_COOLDOWN = 60  # Seconds before the listener can trigger another alert
+
+def frame_rms(data):
+    samples = memoryview(data).cast('h')[::VAD_STRIDE]
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples)) if len(samples) else 0.0
+
+class KeywordListener(QThread):
+    # Always-on microphone listener. Every frame goes through a cheap energy gate;
+    # the recognizer only runs on frames inside a detected speech segment. Recognition
+    # is offline only (Vosk): nothing heard while idle is ever sent to an online service.
+    phrase_heard = pyqtSignal(str, str)
+    failed = pyqtSignal(str)  # The listener has stopped on its own; the reason is shown to the user
+
+    def __init__(self, device_manager, phrases):
+        super().__init__()
+        self.device_manager = device_manager
+        self.set_phrases(phrases)
+        self.running = True
+        self.noise_floor = float(VAD_MIN_RMS)
+        self.segment_frames = 0
+        self.preroll = deque(maxlen=VAD_PREROLL_FRAMES)
+        self.in_speech = False
+        self.quiet_frames = 0
+        self.model = None
+        self.recognizer = None
+        self.last_trigger = -math.inf
+        self.segments = 0
+
+    def set_phrases(self, phrases):
+        self.scanner = KeywordScanner(phrases)
+
+    def run(self):
+        try:
+            self.model = load_vosk_model()
+        except Exception as e:
+            print(f"Failed to load the Vosk model: {str(e)}")
+        if self.model is None:
+            self.failed.emit("The offline Vosk model could not be loaded.")
+            return
+        try:
+            session = self.device_manager.open_session()
+            try:
+                while self.running:
+                    data = session.read()
+                    if data is not None:
+                        self.process_frame(data)
+            finally:
+                session.close()
+        except Exception as e:
+            print(f"Always-on listening stopped: {str(e)}")
+            self.failed.emit(f"The microphone could not be used: {str(e)}")
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+    def is_speech(self, data):
+        rms = frame_rms(data)
+        if rms > max(VAD_MIN_RMS, self.noise_floor * VAD_RATIO):
+            return True
+        self.noise_floor += 0.05 * (rms - self.noise_floor)
+        return False
+
+    def process_frame(self, data):
+        speech = self.is_speech(data)
+        if not self.in_speech:
+            if not speech:
+                self.preroll.append(data)
+                return
+            self.start_segment()
+        self.feed(data)
+        self.quiet_frames = 0 if speech else self.quiet_frames + 1
+        if self.quiet_frames >= VAD_HANGOVER_FRAMES or self.segment_frames >= LISTENER_MAX_SEGMENT_FRAMES:
+            self.end_segment()
+
+    def start_segment(self):
+        self.in_speech = True
+        self.quiet_frames = 0
+        self.segments += 1
+        self.segment_frames = 0
+        self.recognizer = vosk.KaldiRecognizer(self.model, AUDIO_RATE) if self.model else None
+        for frame in self.preroll:
+            self.feed(frame)
+        self.preroll.clear()
+
+    def feed(self, data):
+        self.segment_frames += 1
+        if self.recognizer:
+            self.recognizer.AcceptWaveform(data)
+
+    def end_segment(self):
+        self.in_speech = False
+        if self.recognizer:
+            text = json.loads(self.recognizer.FinalResult())["text"]
+            self.recognizer = None
+            self.check_phrases(text)
+
+    def check_phrases(self, text):
+        found = self.scanner.scan(text)
+        if found and time.monotonic() - self.last_trigger >= LISTENER_COOLDOWN:
+            self.last_trigger = time.monotonic()
+            self.phrase_heard.emit(found[0], text)
+
+VOICE_CALIBRATION_TTL = 300  # Seconds an ambient-noise calibration is reused
+VOICE_LISTEN_TIMEOUT = 5
+VOICE_PHRASE_LIMIT = 8
+
+class SpeechInput:
+    # Shared recognizer; the ambient-noise calibration is kept between commands so
+    # repeat commands skip the calibration delay.
+    def __init__(self, device_manager):
+        self.device_manager = device_manager
+        self.recognizer = None
+        self.calibrated_at = -math.inf
+        self.lock = threading.Lock()
+
+    def listen(self):
+        with self.lock, SessionAudioSource(self.device_manager) as source:
+            if self.recognizer is None:
+                self.recognizer = sr.Recognizer()
+            if time.monotonic() - self.calibrated_at > VOICE_CALIBRATION_TTL:
+                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
+                self.calibrated_at = time.monotonic()
+            try:
+                return self.recognizer.listen(source, timeout=VOICE_LISTEN_TIMEOUT, phrase_time_limit=VOICE_PHRASE_LIMIT)
+            except sr.WaitTimeoutError:
+                return None
+
+    def recognize(self, audio):
+        if audio is None:
+            return "No speech detected"
+        try:
+            return self.recognizer.recognize_google(audio)
+        except sr.UnknownValueError:
+            return "Speech recognition could not understand audio"
+        except sr.RequestError as e:
+            return f"Could not request results from speech recognition service; {e}"
+
+# (intent, phrases), highest priority first. When an utterance contains phrases for
+# several intents the highest-priority one wins, so "cancel sos" is never read as "sos".
+VOICE_INTENTS = [
+    ("cancel_sos", ["cancel sos", "cancel the sos", "cancel my sos", "stop sos", "stop the sos", "sos cancel",
+                    "abort sos", "cancel alert", "cancel the alert"]),
+    ("call_emergency", ["call emergency", "emergency call", "call emergency services", "call 112", "call 911",
+                        "call the police", "call an ambulance"]),
+    ("sos", ["sos", "activate sos", "send sos", "emergency alert"]),
+    ("nearby_safe", ["nearby safe", "safe places", "safe place", "nearest safe", "safe nearby"]),
+    ("check_in", ["check in", "checkin", "check me in"]),
+    ("location", ["location", "where am i", "update my position"]),
+    ("mood", ["mood", "how i feel", "how i am feeling"]),
+]
+
+def normalize_utterance(text):
+    # Unicode-aware and case-folded like tokenize(), so "Über" and Cyrillic phrases survive
+    return " ".join(re.findall(r"[\w']+", text.casefold()))
+
+class IntentMatcher:
+    # All phrases compiled into one word-bounded regex (longest alternatives first);
+    # a single finditer pass collects candidates and the highest priority wins.
+    def __init__(self, intents=VOICE_INTENTS, custom_phrases=None):
+        self.phrases = {}
+        for priority, (intent, phrases) in enumerate(intents):
+            for phrase in phrases:
+                self.phrases.setdefault(normalize_utterance(phrase), (priority, intent))
+        priorities = {intent: priority for priority, (intent, _) in enumerate(intents)}
+        for phrase, intent in (custom_phrases or {}).items():
+            if intent in priorities and normalize_utterance(phrase):
+                self.phrases[normalize_utterance(phrase)] = (priorities[intent], intent)
+        # Words in a phrase may be separated by any run of punctuation or whitespace
+        alternatives = sorted(self.phrases, key=len, reverse=True)
+        self.pattern = re.compile(r"(?<![\w'])(?:" + "|".join(
+            r"[^\w']+".join(re.escape(word) for word in phrase.split()) for phrase in alternatives
+        ) + r")(?![\w'])")
+
+    def match(self, text):
+        best = None
+        for found in self.pattern.finditer(text.casefold()):
+            candidate = self.phrases[normalize_utterance(found.group())]
+            if best is None or candidate < best:
+                best = candidate
+        return best[1] if best else None
+
+class VoiceCommandSession(QThread):
+    # prompt -> listen -> recognize -> dispatch, run entirely off the GUI thread.
+    # The "mood" intent loops back to prompt for a follow-up answer.
+    state_changed = pyqtSignal(str)
+    intent_recognized = pyqtSignal(str, str)
+    mood_recognized = pyqtSignal(str)
+
+    def __init__(self, speech_input, speak, intent_matcher):
+        super().__init__()
+        self.speech_input = speech_input
+        self.speak = speak
+        self.intent_matcher = intent_matcher
+
+    def run(self):
+        # Whatever goes wrong, the last state emitted is "done" so the UI resets
+        try:
+            self.run_states()
+        except Exception as e:
+            print(f"Voice command failed: {str(e)}")
+        self.state_changed.emit("done")
+
+    def run_states(self):
+        state, prompt, follow_up = "prompt", "Please speak your command", False
+        audio = text = None
+        while state != "done":
+            self.state_changed.emit(state)
+            if state == "prompt":
+                self.speak(prompt)
+                state = "listen"
+            elif state == "listen":
+                audio = self.speech_input.listen()
+                state = "recognize"
+            elif state == "recognize":
+                text = self.speech_input.recognize(audio)
+                state = "dispatch"
+            elif state == "dispatch":
+                intent = "mood_answer" if follow_up else self.intent_matcher.match(text)
+                if intent == "mood_answer":
+                    self.mood_recognized.emit(text)
+                elif intent == "mood":
+                    state, prompt, follow_up = "prompt", "How are you feeling?", True
+                    continue
+                elif intent:
+                    self.intent_recognized.emit(intent, text)
+                else:
+                    self.speak("Command not recognized. Please try again.")
+                state = "done"
+
+class LocationHistoryRenderJob(QThread):
+    # Reads, analyses and renders the history on its own thread. Paging a long history back
+    # in takes seconds, which must neither block the GUI nor hold an alert worker.
+    rendered = pyqtSignal(object)  # Track points drawn, or None if rendering failed
+
+    def __init__(self, history, start, path):
+        super().__init__()
+        self.history = history
+        self.start_time = start
+        self.path = path
+
+    def run(self):
+        try:
+            started = time.perf_counter()
+            timestamps, lats, lngs = self.history.between(self.start_time)
+            summary, stops, jumps = None, [], []
+            try:
+                stats = analyse_trajectory(timestamps, lats, lngs)
+                summary, stops, jumps = trajectory_summary(stats), stats.dwells, stats.jumps
+            except ImportError as e:
+                print(f"Trajectory analytics unavailable: {str(e)}")
+            points = LocationHistoryRenderer().render(timestamps, lats, lngs, self.path, summary=summary,
+                                                      stops=stops, jumps=jumps)
+            print(f"Rendered {points} track points from {len(timestamps)} fixes in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"Rendering the location history failed: {str(e)}")
+            points = None
+        self.rendered.emit(points)
+
 class PersonalSafetyApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -77,33 +2265,84 @@ class PersonalSafetyApp(QMainWindow):
         self.setGeometry(100, 100, 1000, 700)
         
         self.user_id = "user123"  # This should be set after user authentication
-        self.load_user_data()
+        with startup_profiler.measure("load user data"):
+            self.load_user_data()
         self.setup_twilio()
+        self.alert_queue = AlertJobQueue()
+        self.location_sources = default_location_sources()
+        self.location_service = LocationService(self.location_sources.locate)
         self.setup_voice_recognition()
-        self.initUI()
-        
-        self.location_tracker = LocationTracker()
+        with startup_profiler.measure("build UI"):
+            self.initUI()
+
+        self.location_tracker = LocationTracker(self.location_service)
         self.location_tracker.location_update.connect(self.update_location_silently)
-        self.location_tracker.start()
-        
-        self.schedule_thread = threading.Thread(target=self.run_schedule, daemon=True)
-        self.schedule_thread.start()
+
+        self.check_in_scheduler = CheckInScheduler()
+        self.schedule_saved_check_ins()
 
         self.sos_timer = QTimer(self)
         self.sos_timer.timeout.connect(self.send_sos)
         self.sos_active = False
 
         # Start monitoring battery
+        self.low_battery_alerted = False
         self.battery_monitor = QTimer(self)
         self.battery_monitor.timeout.connect(self.monitor_battery)
         self.battery_monitor.start(60000)  # Check every 60 seconds
 
-    def load_user_data(self):
+        self.location_sharing = LocationSharingSession()
+        self.geofences = GeofenceEngine()
+        for place in self.user_data["safe_locations"]:
+            self.add_safe_location_fence(place)
+        self.location_sharing_timer = QTimer(self)
+        self.location_sharing_timer.timeout.connect(self.share_location)
+
+        self.keyword_listener = None
+        self.safe_place_index = None  # Built from SAFE_PLACES_OSM_FILE during warm-up
+        self.history_render = None
+
+        # Everything that touches the network or devices starts once the window is up
+        QTimer.singleShot(0, self.start_background_services)
+
+    def start_background_services(self):
+        startup_profiler.mark("event loop running, SOS button clickable")
+        self.location_tracker.start()
+        if self.user_data["always_listening"]:
+            self.toggle_always_listening()
+        threading.Thread(target=self.warm_up, daemon=True, name="warm-up").start()
+
+    # Runs on a background thread: load the heavy modules and services before they are needed.
+    # Every step is guarded on its own, so no microphone or a missing module only skips that step.
+    def warm_up(self):
+        self.warm_up_step("SMS client", self.sms_dispatcher.transport.connect)
+        self.warm_up_step("audio devices", self.audio_devices.start)
+        for module in (sr, pyttsx3, folium, folium_plugins, phonenumbers, psutil, numpy):
+            try:
+                module.load()
+            except Exception as e:
+                print(f"Failed to load {module._name}: {str(e)}")
+        self.warm_up_step("offline speech model", load_vosk_model)
+        if os.path.exists(SAFE_PLACES_OSM_FILE):
+            self.safe_place_index = self.warm_up_step("safe places index", load_osm_safe_places, SAFE_PLACES_OSM_FILE)
+        startup_profiler.mark("warm-up complete")
+        startup_profiler.report()
+
+    @staticmethod
+    def warm_up_step(component, step, *args):
         try:
-            with open('user_data.json', 'r') as f:
-                self.user_data = json.load(f)
-        except FileNotFoundError:
-            self.user_data = {}
+            with startup_profiler.measure(component):
+                return step(*args)
+        except Exception as e:
+            print(f"Warm-up of {component} failed: {str(e)}")
+            return None
+
+    def load_user_data(self):
+        self.data_store = UserDataStore()
+        if self.data_store.is_empty():
+            self.data_store.import_legacy_json()
+        self.user_data = self.data_store.load_profile()
+        self.location_history = LocationHistory(self.data_store)
 
         # Ensure all necessary keys are present
         self.user_data.setdefault("name", "John Doe")
@@ -114,25 +2353,54 @@ class PersonalSafetyApp(QMainWindow):
         self.user_data.setdefault("scheduled_checks", [])
         self.user_data.setdefault("panic_phrase", "Help me")
         self.user_data.setdefault("safe_phrase", "I'm safe")
-        self.user_data.setdefault("location_history", [])
         self.user_data.setdefault("keywords", ["help", "emergency", "danger", "hurt", "scared"])
+        self.user_data.setdefault("always_listening", False)
+        self.user_data.setdefault("voice_commands", {})  # Extra phrase -> intent mappings
+
+        # Safe locations used to be bare names; keep them, without coordinates
+        self.user_data["safe_locations"] = [
+            place if isinstance(place, dict) else {"name": place, "lat": None, "lng": None}
+            for place in self.user_data["safe_locations"]]
 
         self.save_user_data()
 
     def save_user_data(self):
-        with open('user_data.json', 'w') as f:
-            json.dump(self.user_data, f)
+        # Location fixes are appended individually through self.location_history
+        self.data_store.save_profile(self.user_data)
+
+    def record_location(self, location):
+        self.location_history.append(time.time(), location)
 
     def setup_twilio(self):
         account_sid = os.getenv('TWILIO_ACCOUNT_SID', 'insert SID')
         auth_token = os.getenv('TWILIO_AUTH_TOKEN', 'YOUR TOKEN')
         self.twilio_phone_number = os.getenv('TWILIO_PHONE_NUMBER', 'TWILIO PHONE NUMBER')
-        
-        self.twilio_client = Client(account_sid, auth_token)
+
+        # SMS_TRANSPORT=mock runs a local gateway so alerts can be exercised offline
+        transport = os.getenv('SMS_TRANSPORT', 'twilio')
+        self.mock_gateway = None
+        if transport == 'mock':
+            self.mock_gateway = MockSmsGateway(float(os.getenv('SMS_MOCK_LATENCY', MOCK_GATEWAY_LATENCY)),
+                                               float(os.getenv('SMS_MOCK_ERROR_RATE', 0)))
+            sms_transport = HttpGatewayTransport(self.mock_gateway.start())
+        elif transport == 'http':
+            sms_transport = HttpGatewayTransport(os.getenv('SMS_GATEWAY_URL'))
+        else:
+            sms_transport = TwilioTransport(account_sid, auth_token)
+        self.sms_dispatcher = SmsDispatcher(sms_transport, self.twilio_phone_number)
+        self.outbox = AlertOutbox(self.sms_dispatcher)
+        self.last_dispatch_report = None
 
     def setup_voice_recognition(self):
-        self.recognizer = sr.Recognizer()
-        self.engine = pyttsx3.init()
+        self.audio_devices = AudioDeviceManager()
+        self.speech_input = SpeechInput(self.audio_devices)
+        self.voice_session = None
+        self.intent_matcher = IntentMatcher(custom_phrases=self.user_data["voice_commands"])
+        self.update_keyword_scanner()
+
+    # Rebuild the distress keyword automaton whenever user_data["keywords"] changes
+    def update_keyword_scanner(self):
+        self.keyword_scanner = KeywordScanner(self.user_data["keywords"])
 
     def initUI(self):
         self.setStyle(QStyleFactory.create('Fusion'))
@@ -219,6 +2487,11 @@ class PersonalSafetyApp(QMainWindow):
         self.voice_command_button.clicked.connect(self.voice_command)
         home_layout.addWidget(self.voice_command_button)
 
+        self.always_listening_button = QPushButton("Always-On Listening: Off")
+        self.always_listening_button.setStyleSheet("background-color: #39CCCC; color: white; font-size: 14px; padding: 10px; border-radius: 5px;")
+        self.always_listening_button.clicked.connect(self.toggle_always_listening)
+        home_layout.addWidget(self.always_listening_button)
+
         self.mood_input = QLineEdit()
         self.mood_input.setPlaceholderText("How are you feeling? (Simple mood analysis)")
         self.mood_input.setStyleSheet("font-size: 14px; padding: 10px; border-radius: 5px; border: 1px solid #ddd;")
@@ -302,7 +2575,7 @@ class PersonalSafetyApp(QMainWindow):
 
         safe_location_input_layout = QHBoxLayout()
         self.safe_location_input = QLineEdit()
-        self.safe_location_input.setPlaceholderText("Enter safe location name")
+        self.safe_location_input.setPlaceholderText("Safe location name (here), or: Name @ lat, lng")
         self.safe_location_input.setStyleSheet("font-size: 14px; padding: 5px; border-radius: 5px; border: 1px solid #ddd;")
         safe_location_input_layout.addWidget(self.safe_location_input)
 
@@ -313,13 +2586,23 @@ class PersonalSafetyApp(QMainWindow):
 
         safe_locations_layout.addLayout(safe_location_input_layout)
 
+        self.safe_location_arrival_check_in = QCheckBox("Send a safe check-in when I arrive at this place")
+        self.safe_location_arrival_check_in.setStyleSheet("font-size: 14px;")
+        safe_locations_layout.addWidget(self.safe_location_arrival_check_in)
+
+        self.safe_location_night_watch = QCheckBox("Alert my contacts if I leave this place at night")
+        self.safe_location_night_watch.setStyleSheet("font-size: 14px;")
+        safe_locations_layout.addWidget(self.safe_location_night_watch)
+
         tab_widget.addTab(safe_locations_tab, "Safe Locations")
 
         # Map View tab
         map_tab = QWidget()
-        map_layout = QVBoxLayout(map_tab)
-        self.map_view = QWebEngineView()
-        map_layout.addWidget(self.map_view)
+        self.map_layout = QVBoxLayout(map_tab)
+        self.map_view = None  # Created with the first location fix; QtWebEngine is slow to load
+        self.map_js_names = None  # (map, marker) JS variable names once the page is built
+        self.map_ready = False
+        self.pending_map_location = None
         tab_widget.addTab(map_tab, "Map View")
 
         # Safety Tips and Emergency Procedures tab
@@ -369,9 +2652,11 @@ class PersonalSafetyApp(QMainWindow):
             self.sos_timer.start(1000)  # Start the timer, triggering every 1 second
             self.countdown = 10
             self.update_sos_progress()
+            self.update_tracking_mode()
 
     def cancel_sos(self):
         self.sos_active = False
+        self.update_tracking_mode()
         self.sos_timer.stop()
         self.sos_button.setEnabled(True)
         self.cancel_sos_button.hide()
@@ -390,16 +2675,8 @@ class PersonalSafetyApp(QMainWindow):
     # Send SOS Message (with or without delay)
     def send_sos(self, immediate=False):
         if self.sos_active or immediate:
-            location = self.get_location()
-            sos_message = f"SOS Alert: Emergency\nUser: {self.user_data['name']}\nPhone: {self.user_data['phone']}\nLocation: {location}\nMedical Info: {self.user_data['medical_info']}"
-            
             self.start_voice_recording()
-            success = self.send_sms_to_contacts(sos_message)
-            
-            if success:
-                QMessageBox.critical(self, "SOS Sent", "Your SOS has been sent to your emergency contacts.")
-            else:
-                QMessageBox.warning(self, "SOS Send Failed", "Failed to send SOS to some or all contacts. Please try again or contact emergency services directly.")
+            self.enqueue_alert(self.compose_sos_message, on_done=self.on_sos_sent, priority=ALERT_PRIORITY_EMERGENCY)
 
             if not immediate:
                 self.sos_active = False
@@ -411,62 +2688,168 @@ class PersonalSafetyApp(QMainWindow):
             # Start real-time location sharing
             self.start_location_sharing()
 
-    def start_voice_recording(self):
-        self.voice_recorder = VoiceRecorder()
-        self.voice_recorder.finished.connect(self.process_voice_recording)
-        self.voice_recorder.start()
+    def compose_sos_message(self, location):
+        message = f"SOS Alert: Emergency\nUser: {self.user_data['name']}\nPhone: {self.user_data['phone']}\nLocation: {location}\nMedical Info: {self.user_data['medical_info']}"
+        movement = self.describe_recent_movement()
+        if movement:
+            message += f"\nMovement: {movement}"
+        return message
 
-    def process_voice_recording(self, text):
-        spotted_keywords = [word for word in self.user_data["keywords"] if word in text.lower()]
-        if spotted_keywords:
-            keyword_message = f"Spotted keywords: {', '.join(spotted_keywords)}\nContext: {text}"
-            self.send_sms_to_contacts(keyword_message)
+    # Runs on an alert worker: one line on what the recent history shows
+    def describe_recent_movement(self):
+        try:
+            stats = analyse_trajectory(*self.location_history.between(time.time() - TRAJECTORY_SOS_WINDOW))
+        except ImportError:
+            return None
+        if stats.fixes < 2:
+            return None
+        if stats.dwells and stats.dwells[-1].departed == stats.end:
+            dwell = stats.dwells[-1]
+            return (f"stationary for {(dwell.departed - dwell.arrived) / 60:.0f} min "
+                    f"at {dwell.lat:.5f}, {dwell.lng:.5f}")
+        movement = f"{stats.distance_m / 1000:.1f} km in the last {(stats.end - stats.start) / 3600:.1f} h"
+        if len(stats.speeds) and stats.speeds[-1] <= TRAJECTORY_JUMP_SPEED:
+            movement += f", current speed {stats.speeds[-1] * 3.6:.0f} km/h"
+        return movement
+
+    def on_sos_sent(self, success):
+        if success:
+            QMessageBox.critical(self, "SOS Sent", "Your SOS has been sent to your emergency contacts.")
+        else:
+            QMessageBox.warning(self, "SOS Send Failed", "Failed to send SOS to some or all contacts. It will be retried automatically; contact emergency services directly if you can.")
 
-    def send_sms_to_contacts(self, message):
-        success = True
-        for contact in self.user_data["emergency_contacts"]:
-            try:
-                self.twilio_client.messages.create(
-                    body=message,
-                    from_=self.twilio_phone_number,
-                    to=contact
-                )
-            except Exception as e:
-                print(f"Failed to send SMS to {contact}: {str(e)}")
-                success = False
-        return success
+    def start_voice_recording(self, triggered_at=None):
+        self.voice_recorder = VoiceRecorder(self.audio_devices, keyword_scanner=self.keyword_scanner,
+                                            triggered_at=triggered_at)
+        self.voice_recorder.keyword_spotted.connect(self.process_voice_recording)
+        self.voice_recorder.start()
 
-    def get_location(self):
-        g = geocoder.ip('me')
-        return g.latlng
+    def process_voice_recording(self, spotted_keywords, text, latency):
+        print(f"Spotted {', '.join(spotted_keywords)} {latency:.2f}s after the audio was captured")
+        keyword_message = f"Spotted keywords: {', '.join(spotted_keywords)}\nContext: {text}"
+        self.alert_queue.submit(self.send_sms_to_contacts, keyword_message, ALERT_PRIORITY_EMERGENCY,
+                                priority=ALERT_PRIORITY_EMERGENCY)
+
+    # Runs on an alert worker: resolve the location, then hand the message to the outbox
+    def deliver_alert(self, compose, location_budget=None, priority=ALERT_PRIORITY_NORMAL, on_done=None):
+        location = self.get_location(location_budget)
+        self.send_sms_to_contacts(compose(location), priority, on_done)
+
+    # Emergency alerts race all location sources for SOS_LOCATION_BUDGET seconds
+    def enqueue_alert(self, compose, on_done=None, priority=ALERT_PRIORITY_NORMAL):
+        budget = SOS_LOCATION_BUDGET if priority == ALERT_PRIORITY_EMERGENCY else None
+        self.alert_queue.submit(self.deliver_alert, compose, budget, priority, on_done, priority=priority)
+
+    # Queues the message without waiting for delivery; on_done(success) runs on the GUI
+    # thread once every contact's first attempt is over. Failures keep being retried.
+    def send_sms_to_contacts(self, message, priority=ALERT_PRIORITY_NORMAL, on_done=None):
+        def first_attempt(report):
+            for result in report.results:
+                if not result.success:
+                    print(f"Failed to send SMS to {result.contact}: {result.error} (will retry)")
+            print(report.summary())
+            self.last_dispatch_report = report
+            if on_done:
+                self.alert_queue.post(on_done, report.success)
+
+        self.outbox.enqueue(message, self.user_data["emergency_contacts"], priority=priority,
+                            on_first_attempt=first_attempt)
+
+    def get_location(self, budget=None):
+        if budget:
+            # A recent fix is as good as a new IP lookup; only race when there's
+            # something better to wait for
+            cached = self.location_service.fresh()
+            if cached and not self.location_sources.has_precise_source():
+                return cached
+            location = self.location_sources.locate(budget)
+            if location:
+                self.location_service.store(location)
+                return location
+            return self.location_service.peek()  # Last known fix rather than blowing the budget
+        return self.location_service.get()
 
     def update_location(self):
-        location = self.get_location()
+        self.alert_queue.submit(self.get_location, on_done=self.on_location_updated)
+
+    def on_location_updated(self, location):
         if location:
-            self.user_data["location_history"].append({"timestamp": time.time(), "location": location})
-            self.save_user_data()
-            self.update_map_view()
+            self.update_location_silently(location)
             QMessageBox.information(self, "Location Updated", f"Your location has been updated: {location}")
         else:
             QMessageBox.critical(self, "Location Error", "Unable to retrieve location")
 
     def update_location_silently(self, location):
         if location:
-            self.user_data["location_history"].append({"timestamp": time.time(), "location": location})
-            self.save_user_data()
+            self.record_location(location)
+            for event in self.geofences.update(location[0], location[1]):
+                self.on_geofence_event(event)
             self.update_map_view()
 
+    def add_safe_location_fence(self, place):
+        if place["lat"] is not None:
+            self.geofences.add_circle(place["name"], place["lat"], place["lng"],
+                                      place.get("radius", SAFE_LOCATION_RADIUS_M), data=place)
+
+    def on_geofence_event(self, event):
+        place = event.fence.data
+        print(f"Geofence {event.kind}: {place['name']}")
+        if event.kind == "enter":
+            # Opt-in per place: a coarse fix (IP lookups are only good to a few km) can
+            # wander into a small fence
+            if not place.get("check_in_on_arrival"):
+                return
+            self.enqueue_alert(
+                lambda location: f"Safe Check-In: {self.user_data['name']} has arrived at {place['name']}. Location: {location}")
+        elif place.get("alert_on_exit") and in_hours(datetime.now().hour, *SAFE_LOCATION_NIGHT_HOURS):
+            left_at = datetime.fromtimestamp(event.timestamp).strftime("%H:%M")
+            self.enqueue_alert(
+                lambda location: f"Safety Alert: {self.user_data['name']} left {place['name']} unexpectedly at {left_at}. Current location: {location}",
+                priority=ALERT_PRIORITY_EMERGENCY)
+            self.start_location_sharing()
+
     def update_map_view(self):
-        if self.user_data["location_history"]:
-            latest_location = self.user_data["location_history"][-1]["location"]
-            m = folium.Map(location=latest_location, zoom_start=13)
-            folium.Marker(latest_location, popup="Current Location").add_to(m)
-            
-            # Save the map as HTML
-            m.save("current_location.html")
-            
-            # Load the HTML file into the QWebEngineView
-            self.map_view.setUrl(QUrl.fromLocalFile(os.path.abspath("current_location.html")))
+        latest = self.location_history.latest()
+        if latest:
+            latest_location = [latest.lat, latest.lng]
+            if self.map_js_names is None:
+                self.load_map_page(latest_location)
+            elif self.map_ready:
+                self.move_map_marker(latest_location)
+            else:
+                self.pending_map_location = latest_location
+
+    # The map page is generated and loaded once; later fixes only move the marker
+    def load_map_page(self, location):
+        if self.map_view is None:
+            with startup_profiler.measure("map view"):
+                from PyQt5.QtWebEngineWidgets import QWebEngineView
+                self.map_view = QWebEngineView()
+            self.map_view.loadFinished.connect(self.on_map_loaded)
+            self.map_layout.addWidget(self.map_view)
+
+        m = folium.Map(location=location, zoom_start=13)
+        marker = folium.Marker(location, popup="Current Location")
+        marker.add_to(m)
+        self.map_js_names = (m.get_name(), marker.get_name())
+        self.map_ready = False
+
+        # Save the map as HTML
+        m.save("current_location.html")
+
+        # Load the HTML file into the QWebEngineView
+        self.map_view.setUrl(QUrl.fromLocalFile(os.path.abspath("current_location.html")))
+
+    def on_map_loaded(self, ok):
+        self.map_ready = ok
+        if ok and self.pending_map_location is not None:
+            self.move_map_marker(self.pending_map_location)
+            self.pending_map_location = None
+
+    def move_map_marker(self, location):
+        map_name, marker_name = self.map_js_names
+        latlng = json.dumps([float(location[0]), float(location[1])])
+        self.map_view.page().runJavaScript(f"{marker_name}.setLatLng({latlng}); {map_name}.panTo({latlng});")
 
     def show_safety_alerts(self):
         # In a real application, you would fetch alerts from an API or local database
@@ -509,69 +2892,111 @@ class PersonalSafetyApp(QMainWindow):
         self.user_data["panic_phrase"] = new_panic_phrase
         self.user_data["safe_phrase"] = new_safe_phrase
         self.save_user_data()
+        if self.keyword_listener:
+            self.keyword_listener.set_phrases(self.listener_phrases())
         
         QMessageBox.information(self, "Profile Updated", "Your profile has been updated successfully!")
 
     def safe_check_in(self):
-        location = self.get_location()
-        message = f"Safe Check-In: {self.user_data['name']} has checked in safely at location: {location}"
-        success = self.send_sms_to_contacts(message)
-        
+        self.enqueue_alert(
+            lambda location: f"Safe Check-In: {self.user_data['name']} has checked in safely at location: {location}",
+            on_done=self.on_safe_check_in_sent)
+
+    def on_safe_check_in_sent(self, success):
         if success:
             QMessageBox.information(self, "Safe Check-In", "Your safe check-in has been sent to your emergency contacts.")
         else:
             QMessageBox.warning(self, "Check-In Failed", "Failed to send check-in to some or all contacts. Please try again.")
 
     def add_safe_location(self):
-        location_name = self.safe_location_input.text()
-        if location_name:
-            self.user_data["safe_locations"].append(location_name)
-            self.update_safe_locations_list()
-            self.save_user_data()
-            QMessageBox.information(self, "Safe Location Added", f"Safe location '{location_name}' added successfully!")
-            self.safe_location_input.clear()
-        else:
+        location_name, _, coordinates = self.safe_location_input.text().partition("@")
+        location_name = location_name.strip()
+        if not location_name:
             QMessageBox.warning(self, "Input Error", "Please enter a location name")
+        elif coordinates:
+            try:
+                lat, lng = (float(value) for value in coordinates.split(","))
+            except ValueError:
+                QMessageBox.warning(self, "Input Error", "Coordinates should look like: Home @ 52.52, 13.405")
+                return
+            self.save_safe_location(location_name, [lat, lng])
+        else:
+            # Without coordinates the safe location is wherever the user is now
+            self.alert_queue.submit(self.get_location,
+                                    on_done=lambda location: self.save_safe_location(location_name, location))
+
+    def save_safe_location(self, location_name, location):
+        if not location:
+            QMessageBox.warning(self, "Location Error", "Unable to retrieve your location.")
+            return
+        place = {"name": location_name, "lat": location[0], "lng": location[1],
+                 "check_in_on_arrival": self.safe_location_arrival_check_in.isChecked(),
+                 "alert_on_exit": self.safe_location_night_watch.isChecked()}
+        self.user_data["safe_locations"].append(place)
+        self.add_safe_location_fence(place)
+        self.update_safe_locations_list()
+        self.save_user_data()
+        QMessageBox.information(self, "Safe Location Added", f"Safe location '{location_name}' added successfully!")
+        self.safe_location_input.clear()
 
     def update_safe_locations_list(self):
         self.safe_locations_list.clear()
-        for location in self.user_data["safe_locations"]:
-            self.safe_locations_list.addItem(location)
+        for place in self.user_data["safe_locations"]:
+            if place["lat"] is None:
+                self.safe_locations_list.addItem(f"{place['name']} (no coordinates)")
+            else:
+                options = [label for key, label in (("check_in_on_arrival", "check-in on arrival"),
+                                                    ("alert_on_exit", "watched at night")) if place.get(key)]
+                watched = "".join(f" - {label}" for label in options)
+                self.safe_locations_list.addItem(f"{place['name']} ({place['lat']:.5f}, {place['lng']:.5f}){watched}")
 
     def schedule_check_in(self):
         time, ok = QInputDialog.getText(self, "Schedule Check-In", "Enter check-in time (YYYY-MM-DD HH:MM):")
         if ok:
             try:
                 check_time = datetime.strptime(time, "%Y-%m-%d %H:%M")
+                if check_time <= datetime.now():
+                    QMessageBox.warning(self, "Invalid Input", "Please enter a time in the future.")
+                    return
                 self.user_data["scheduled_checks"].append(check_time.strftime("%Y-%m-%d %H:%M"))
                 self.save_user_data()
-                self.update_schedule()
+                self.schedule_one_check_in(check_time.strftime("%Y-%m-%d %H:%M"))
                 QMessageBox.information(self, "Check-In Scheduled", f"Check-in scheduled for {time}")
             except ValueError:
                 QMessageBox.warning(self, "Invalid Input", "Please enter the time in the correct format.")
 
-    def update_schedule(self):
-        schedule.clear()
+    # Check-ins that came due while the app was closed go out now if they are recent
+    # enough to matter; older ones are dropped from the schedule
+    def schedule_saved_check_ins(self):
+        now = time.time()
+        kept = []
         for check_time in self.user_data["scheduled_checks"]:
-            dt = datetime.strptime(check_time, "%Y-%m-%d %H:%M")
-            if dt > datetime.now():
-                schedule.every().day.at(dt.strftime("%H:%M")).do(self.scheduled_check_in, check_time).tag(check_time)
+            due = datetime.strptime(check_time, "%Y-%m-%d %H:%M").timestamp()
+            if due <= now - CHECK_IN_MISSED_GRACE:
+                print(f"Dropping check-in scheduled for {check_time}, missed while the app was closed")
+                continue
+            if due <= now:
+                print(f"Check-in scheduled for {check_time} was missed while the app was closed, sending it now")
+            kept.append(check_time)
+        if len(kept) < len(self.user_data["scheduled_checks"]):
+            self.user_data["scheduled_checks"] = kept
+            self.save_user_data()
+        for check_time in kept:
+            self.schedule_one_check_in(check_time)
+
+    def schedule_one_check_in(self, check_time):
+        # Times already past fire straight away
+        dt = datetime.strptime(check_time, "%Y-%m-%d %H:%M")
+        self.check_in_scheduler.schedule_at(dt.timestamp(), self.scheduled_check_in, check_time)
 
+    # Runs on the scheduler thread; delivery is handed to the alert queue
     def scheduled_check_in(self, check_time):
-        location = self.get_location()
-        message = f"Scheduled Check-In: {self.user_data['name']} was scheduled to check in at {check_time}. Current location: {location}"
-        self.send_sms_to_contacts(message)
-        
+        self.enqueue_alert(
+            lambda location: f"Scheduled Check-In: {self.user_data['name']} was scheduled to check in at {check_time}. Current location: {location}")
+
         # Remove the completed check-in from the schedule
         self.user_data["scheduled_checks"].remove(check_time)
         self.save_user_data()
-        self.update_schedule()
-
-    def run_schedule(self):
-        self.update_schedule()
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
 
     def analyze_mood(self):
         text = self.mood_input.text()
@@ -596,21 +3021,30 @@ class PersonalSafetyApp(QMainWindow):
             QMessageBox.warning(self, "Input Error", "Please enter some text to analyze your mood.")
 
     def view_location_history(self):
-        if not self.user_data["location_history"]:
+        if not len(self.location_history):
             QMessageBox.information(self, "No Data", "No location history available.")
             return
 
-        m = folium.Map(location=self.user_data["location_history"][-1]["location"], zoom_start=10)
-        
-        for entry in self.user_data["location_history"]:
-            folium.Marker(
-                entry["location"],
-                popup=datetime.fromtimestamp(entry["timestamp"]).strftime('%Y-%m-%d %H:%M:%S')
-            ).add_to(m)
+        time_range, ok = QInputDialog.getItem(self, "Location History", "Show:", list(HISTORY_RANGES), 0, False)
+        if not ok:
+            return
+        if self.history_render and self.history_render.isRunning():
+            QMessageBox.information(self, "Location History", "The location history is still being prepared.")
+            return
+        window = HISTORY_RANGES[time_range]
+        start = time.time() - window if window else None
+        self.history_render = LocationHistoryRenderJob(self.location_history, start, "location_history.html")
+        self.history_render.rendered.connect(self.on_location_history_rendered)
+        self.history_render.start()
+
+    def on_location_history_rendered(self, points):
+        if points is None:
+            QMessageBox.warning(self, "Location History", "Could not render the location history.")
+            return
+        if not points:
+            QMessageBox.information(self, "No Data", "No location history in the selected time range.")
+            return
 
-        # Save the map as HTML
-        m.save("location_history.html")
-        
         # Open the HTML file in the default web browser
         QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath("location_history.html")))
 
@@ -622,79 +3056,127 @@ class PersonalSafetyApp(QMainWindow):
             self.confirm_safety()
         super().keyPressEvent(event)
 
+    # Background listening for the panic phrase and distress keywords
+    def listener_phrases(self):
+        return [self.user_data["panic_phrase"]] + self.user_data["keywords"]
+
+    def toggle_always_listening(self):
+        if self.keyword_listener:
+            self.keyword_listener.stop()
+            self.keyword_listener = None
+        elif not os.path.isdir(VOSK_MODEL_PATH):
+            QMessageBox.warning(self, "Always-On Listening",
+                                "Always-on listening needs an offline Vosk model (see the README), so that "
+                                "nothing you say is sent to an online speech service.")
+        else:
+            listener = self.keyword_listener = KeywordListener(self.audio_devices, self.listener_phrases())
+            listener.phrase_heard.connect(self.on_phrase_heard)
+            listener.failed.connect(lambda reason: self.on_always_listening_failed(listener, reason))
+            listener.start()
+        self.update_always_listening_state()
+
+    def update_always_listening_state(self):
+        listening = self.keyword_listener is not None
+        self.always_listening_button.setText(f"Always-On Listening: {'On' if listening else 'Off'}")
+        if self.user_data["always_listening"] != listening:
+            self.user_data["always_listening"] = listening
+            self.save_user_data()
+
+    def on_always_listening_failed(self, listener, reason):
+        # Never leave the button saying "On" when nothing is listening
+        if listener is not self.keyword_listener:
+            return
+        listener.wait()
+        self.keyword_listener = None
+        self.update_always_listening_state()
+        QMessageBox.warning(self, "Always-On Listening", f"Always-on listening has stopped. {reason}")
+
+    def on_phrase_heard(self, phrase, text):
+        print(f"Heard '{phrase}' while listening: {text}")
+        self.send_panic_alert()
+
     def send_panic_alert(self):
-        location = self.get_location()
-        message = f"PANIC ALERT: {self.user_data['name']} has triggered their panic phrase. Current location: {location}"
-        self.send_sms_to_contacts(message)
+        self.enqueue_alert(
+            lambda location: f"PANIC ALERT: {self.user_data['name']} has triggered their panic phrase. Current location: {location}",
+            on_done=self.on_panic_alert_sent, priority=ALERT_PRIORITY_EMERGENCY)
         self.start_voice_recording()
+
+    def on_panic_alert_sent(self, success):
         QMessageBox.critical(self, "Panic Alert Sent", "Your panic alert has been sent to your emergency contacts.")
 
     def confirm_safety(self):
-        location = self.get_location()
-        message = f"Safety Confirmation: {self.user_data['name']} has confirmed their safety. Current location: {location}"
-        self.send_sms_to_contacts(message)
+        self.enqueue_alert(
+            lambda location: f"Safety Confirmation: {self.user_data['name']} has confirmed their safety. Current location: {location}",
+            on_done=self.on_safety_confirmed)
+
+    def on_safety_confirmed(self, success):
         QMessageBox.information(self, "Safety Confirmed", "Your safety confirmation has been sent to your emergency contacts.")
 
+    # Called from the voice command worker thread
     def text_to_speech(self, text):
-        self.engine.say(text)
-        self.engine.runAndWait()
-
-    def speech_to_text(self):
-        with sr.Microphone() as source:
-            self.recognizer.adjust_for_ambient_noise(source)
-            audio = self.recognizer.listen(source)
-            try:
-                text = self.recognizer.recognize_google(audio)
-                return text
-            except sr.UnknownValueError:
-                return "Speech recognition could not understand audio"
-            except sr.RequestError as e:
-                return f"Could not request results from speech recognition service; {e}"
+        self.audio_devices.speak(text)
 
     def voice_command(self):
-        self.text_to_speech("Please speak your command")
-        command = self.speech_to_text()
-        if "sos" in command.lower():
-            self.activate_sos()
-        elif "cancel" in command.lower() and "sos" in command.lower():
-            self.cancel_sos()
-        elif "check in" in command.lower():
-            self.safe_check_in()
-        elif "location" in command.lower():
-            self.update_location()
-        elif "emergency" in command.lower() and "call" in command.lower():
-            self.call_emergency_services()
-        elif "nearby" in command.lower() and "safe" in command.lower():
-            self.find_nearby_safe_places()
-        elif "mood" in command.lower():
-            self.text_to_speech("How are you feeling?")
-            mood = self.speech_to_text()
-            self.mood_input.setText(mood)
-            self.analyze_mood()
-        else:
-            self.text_to_speech("Command not recognized. Please try again.")
+        if self.voice_session and self.voice_session.isRunning():
+            return
+        self.voice_session = VoiceCommandSession(self.speech_input, self.text_to_speech, self.intent_matcher)
+        self.voice_session.state_changed.connect(self.on_voice_state_changed)
+        self.voice_session.intent_recognized.connect(self.dispatch_voice_intent)
+        self.voice_session.mood_recognized.connect(self.on_mood_recognized)
+        self.voice_session.start()
+
+    def on_voice_state_changed(self, state):
+        labels = {"prompt": "Voice Command (speaking...)", "listen": "Voice Command (listening...)",
+                  "recognize": "Voice Command (recognizing...)", "dispatch": "Voice Command (recognizing...)"}
+        self.voice_command_button.setText(labels.get(state, "Voice Command"))
+
+    def dispatch_voice_intent(self, intent, text):
+        actions = {
+            "sos": self.activate_sos,
+            "cancel_sos": self.cancel_sos,
+            "check_in": self.safe_check_in,
+            "location": self.update_location,
+            "call_emergency": self.call_emergency_services,
+            "nearby_safe": self.find_nearby_safe_places,
+        }
+        actions[intent]()
+
+    def on_mood_recognized(self, mood):
+        self.mood_input.setText(mood)
+        self.analyze_mood()
 
     def find_nearby_safe_places(self):
+        self.alert_queue.submit(self.nearby_safe_places, on_done=self.show_nearby_safe_places)
+
+    # Runs on an alert worker: the user's own safe locations plus the OpenStreetMap index
+    def nearby_safe_places(self):
         location = self.get_location()
         if not location:
+            return None
+        lat, lng = location
+        safe_places = [(haversine_m(lat, lng, place["lat"], place["lng"]),
+                        SafePlace(place["name"], "saved", place["lat"], place["lng"]))
+                       for place in self.user_data["safe_locations"] if place["lat"] is not None]
+        if self.safe_place_index:
+            safe_places.extend(self.safe_place_index.nearest(lat, lng))
+        return sorted(safe_places)[:SAFE_PLACE_RESULTS]
+
+    def show_nearby_safe_places(self, safe_places):
+        if safe_places is None:
             QMessageBox.warning(self, "Location Error", "Unable to retrieve your location.")
             return
-
-        # In a real application, you would use a places API (e.g., Google Places API) to get this information
-        # For this example, we'll use dummy data
-        safe_places = [
-            {"name": "Central Police Station", "distance": "0.5 km"},
-            {"name": "City Hospital", "distance": "1.2 km"},
-            {"name": "Fire Department", "distance": "0.8 km"},
-            {"name": "Community Center", "distance": "1.5 km"}
-        ]
+        if not safe_places:
+            QMessageBox.information(self, "Nearby Safe Places",
+                                    "No safe places known nearby. Add safe locations, or put an OpenStreetMap "
+                                    f"extract at {SAFE_PLACES_OSM_FILE}.")
+            return
 
         safe_places_dialog = QDialog(self)
         safe_places_dialog.setWindowTitle("Nearby Safe Places")
         layout = QVBoxLayout()
 
-        for place in safe_places:
-            layout.addWidget(QLabel(f"{place['name']} - {place['distance']}"))
+        for distance, place in safe_places:
+            layout.addWidget(QLabel(f"{place.name} ({place.category.replace('_', ' ')}) - {distance / 1000:.1f} km"))
 
 
         close_button = QPushButton("Close")
@@ -712,27 +3194,48 @@ class PersonalSafetyApp(QMainWindow):
     # Battery Monitoring for Low Battery Alerts
     def monitor_battery(self):
         battery = psutil.sensors_battery()
-        if battery and battery.percent < 20 and not battery.power_plugged:
+        low = bool(battery and battery.percent < 20 and not battery.power_plugged)
+        if low and not self.low_battery_alerted:
+            # Once per discharge, not every minute
             low_battery_message = f"Low Battery Alert: {self.user_data['name']} has less than 20% battery remaining. Please ensure their safety."
-            self.send_sms_to_contacts(low_battery_message)
+            self.alert_queue.submit(self.send_sms_to_contacts, low_battery_message, ALERT_PRIORITY_BACKGROUND,
+                                    priority=ALERT_PRIORITY_BACKGROUND)
+        self.low_battery_alerted = low
 
     # Real-time Location Sharing with Emergency Contacts
     def start_location_sharing(self):
-        self.location_sharing_active = True
-        self.location_sharing_timer = QTimer(self)
-        self.location_sharing_timer.timeout.connect(self.share_location)
-        self.location_sharing_timer.start(60000)  # Share location every 60 seconds
+        if not self.location_sharing.start():
+            return  # Already sharing, e.g. a second SOS during the same incident
+        self.location_sharing_timer.start(LOCATION_SHARING_INTERVAL * 1000)
+        self.update_tracking_mode()
 
     def share_location(self):
-        if self.location_sharing_active:
-            location = self.get_location()
-            location_message = f"Real-time Location Update: {self.user_data['name']} is currently at {location}."
-            self.send_sms_to_contacts(location_message)
+        if self.location_sharing.begin_update():
+            self.alert_queue.submit(self.deliver_location_update, on_done=self.on_location_update_done,
+                                    priority=ALERT_PRIORITY_BACKGROUND)
+
+    def deliver_location_update(self):
+        location = self.get_location()
+        if not location:
+            return 0
+        alert_id, contacts = self.location_sharing.plan(location, self.user_data["emergency_contacts"])
+        if contacts:
+            message = f"Real-time Location Update: {self.user_data['name']} is currently at {location}."
+            self.outbox.enqueue(message, contacts, alert_id=alert_id, priority=ALERT_PRIORITY_BACKGROUND,
+                                supersedes=self.location_sharing.alert_prefix)
+        return len(contacts)
+
+    def on_location_update_done(self, sent):
+        self.location_sharing.end_update()
 
     def stop_location_sharing(self):
-        self.location_sharing_active = False
-        if hasattr(self, 'location_sharing_timer'):
-            self.location_sharing_timer.stop()
+        self.location_sharing.stop()
+        self.location_sharing_timer.stop()
+        self.update_tracking_mode()
+
+    # Fast location polling from the SOS countdown until location sharing ends
+    def update_tracking_mode(self):
+        self.location_tracker.set_sos_active(self.sos_active or self.location_sharing.active)
 
     def closeEvent(self, event):
         self.stop_location_sharing()
@@ -741,11 +3244,24 @@ class PersonalSafetyApp(QMainWindow):
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
+            self.check_in_scheduler.stop()
+            self.location_tracker.stop()
+            if self.keyword_listener:
+                self.keyword_listener.stop()
+            self.audio_devices.shutdown()
+            self.alert_queue.stop()
+            self.outbox.stop()
+            self.sms_dispatcher.shutdown()
+            if self.mock_gateway:
+                self.mock_gateway.stop()
+            self.data_store.close()
             event.accept()
         else:
             event.ignore()
 
 if __name__ == '__main__':
+    # Lets QtWebEngineWidgets be imported after the QApplication exists
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication(sys.argv)
     app.setStyle(QStyleFactory.create('Fusion'))
     
@@ -771,8 +3287,10 @@ if __name__ == '__main__':
     app.setWindowIcon(app_icon)
 
     # Create and show the main window
-    main_window = PersonalSafetyApp()
+    with startup_profiler.measure("create main window"):
+        main_window = PersonalSafetyApp()
     main_window.show()
+    startup_profiler.mark("window shown")
 
     # Start the event loop
     sys.exit(app.exec_())